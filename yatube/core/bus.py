@@ -0,0 +1,198 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import request_started
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Больше этого сообщение режется на части: датаграмма не бесконечна.
+max_message: int = 32 * 1024
+keys_per_message: int = 200
+# Так часто слушатель проверяет, что файл его сокета на месте.
+poll_timeout: float = 1
+retry_delay: float = 1
+
+handlers = []
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def subscribe(handler):
+    """Регистрирует handler(keys, tags), сбрасывающий локальные копии.
+
+    Тег - имя области, как у поколений в posts.cache: "index",
+    "group:<slug>". Ключи области начинаются с "<тег>:".
+    """
+    handlers.append(handler)
+    return handler
+
+
+def dispatch(keys, tags):
+    for handler in handlers:
+        try:
+            handler(keys, tags)
+        except Exception:
+            logger.exception("Обработчик шины %r упал", handler)
+
+
+def socket_path(pid=None):
+    return os.path.join(
+        settings.INVALIDATION_BUS_DIR, f"{pid or os.getpid()}.sock"
+    )
+
+
+def publish(keys=(), tags=(), local=True):
+    """Рассылает инвалидацию всем процессам хоста.
+
+    Каждый процесс слушает свой датаграммный UNIX-сокет в
+    INVALIDATION_BUS_DIR, отправитель пишет во все сокеты каталога.
+    Сокеты умерших процессов удаляются при отправке. Доставка
+    не гарантирована: если очередь процесса переполнена, сообщение
+    теряется, и локальная копия живёт до своего короткого TTL.
+    """
+    keys, tags = list(keys), list(tags)
+    if not keys and not tags:
+        return
+    if local:
+        dispatch(keys, tags)
+    messages = [json.dumps({"keys": [], "tags": tags})] if tags else []
+    messages += [
+        json.dumps({"keys": keys[start:start + keys_per_message], "tags": []})
+        for start in range(0, len(keys), keys_per_message)
+    ]
+    own = socket_path()
+    peers = [
+        path for path in glob.glob(socket_path("*")) if path != own
+    ]
+    if not peers:
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+        sender.setblocking(False)
+        for path in peers:
+            for message in messages:
+                if not send(sender, path, message.encode()):
+                    break
+
+
+def send(sender, path, data):
+    """False, если получателю больше не слать."""
+    if len(data) > max_message:
+        logger.warning("Сообщение шины длиннее %s байт", max_message)
+        return False
+    try:
+        sender.sendto(data, path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Процесс умер, не убрав сокет.
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        return False
+    except BlockingIOError:
+        logger.warning("Очередь шины %s переполнена", path)
+        return False
+    except OSError:
+        logger.exception("Не удалось отправить в %s", path)
+        return False
+    return True
+
+
+def listen():
+    """Запускает поток-слушатель процесса; после fork - заново."""
+    global _listener
+    with _listener_lock:
+        if (
+            _listener is not None
+            and _listener[0] == os.getpid()
+            and _listener[1].is_alive()
+        ):
+            return
+        thread = threading.Thread(
+            target=serve, name="invalidation-bus", daemon=True
+        )
+        thread.start()
+        _listener = (os.getpid(), thread)
+
+
+def serve():
+    """Слушает сокет; при любой ошибке привязывается к нему заново."""
+    path = socket_path()
+    while True:
+        try:
+            receive(path)
+        except OSError as error:
+            logger.warning("Шина инвалидации переподключается: %s", error)
+        except Exception:
+            logger.exception("Шина инвалидации переподключается")
+        time.sleep(retry_delay)
+
+
+def receive(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as listener:
+        listener.bind(path)
+        listener.settimeout(poll_timeout)
+        inode = os.stat(path).st_ino
+        while True:
+            try:
+                data = listener.recv(max_message)
+            except socket.timeout:
+                # Файл сокета могли удалить или подменить, например при
+                # очистке временного каталога: тогда до нас не дойдут.
+                if not replaced(path, inode):
+                    continue
+                raise ConnectionResetError(f"сокет {path} удалён")
+            message = json.loads(data)
+            dispatch(message.get("keys", []), message.get("tags", []))
+
+
+def replaced(path, inode):
+    try:
+        return os.stat(path).st_ino != inode
+    except FileNotFoundError:
+        return True
+
+
+@atexit.register
+def remove_socket():
+    if _listener is not None and _listener[0] == os.getpid():
+        try:
+            os.unlink(socket_path())
+        except OSError:
+            pass
+
+
+@receiver(request_started)
+def start_listening(sender, **kwargs):
+    listen()
+
+
+@subscribe
+def drop_locmem_copies(keys, tags):
+    """LocMemCache хранит копии в памяти процесса: их тоже сбрасываем."""
+    for alias, options in settings.CACHES.items():
+        if not options["BACKEND"].endswith(".LocMemCache"):
+            continue
+        cache = caches[alias]
+        for key in keys:
+            cache.delete(key)
+        if tags:
+            prefixes = tuple(cache.make_key(f"{tag}:") for tag in tags)
+            # Публичного удаления по префиксу у LocMemCache нет.
+            with cache._lock:
+                for key in [k for k in cache._cache if k.startswith(prefixes)]:
+                    cache._cache.pop(key, None)
+                    cache._expire_info.pop(key, None)
@@ -0,0 +1,54 @@
+import re
+from urllib.parse import parse_qsl, urlencode
+
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+HOLE_RE = re.compile(rb"<!--hole:([\w.-]+)\?([^>]*?)-->")
+
+fragments = {}
+
+
+def fragment(name):
+    """Регистрирует функцию, рисующую персональный фрагмент страницы."""
+    def decorator(func):
+        fragments[name] = func
+        return func
+    return decorator
+
+
+def punch(request, name, **kwargs):
+    """Рисует фрагмент или, при рендере общей копии, оставляет метку."""
+    if getattr(request, "punch_holes", False):
+        return mark_safe(f"<!--hole:{name}?{urlencode(kwargs)}-->")
+    return mark_safe(fragments[name](request, **kwargs))
+
+
+def fill_holes(request, response):
+    """Подставляет в общую закэшированную страницу фрагменты пользователя."""
+    def render(match):
+        name = match.group(1).decode()
+        kwargs = dict(parse_qsl(match.group(2).decode()))
+        return fragments[name](request, **kwargs).encode()
+
+    if response.streaming or HOLE_RE.search(response.content) is None:
+        return response
+    response.content = HOLE_RE.sub(render, response.content)
+    patch_cache_control(response, private=True)
+    return response
+
+
+@fragment("header")
+def header(request):
+    return render_to_string("includes/header.html", request=request)
+
+
+@fragment("csrf_token")
+def csrf_token(request):
+    return format_html(
+        '<input type="hidden" name="csrfmiddlewaretoken" value="{}">',
+        get_token(request),
+    )
@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.shm_cache import SharedMemoryCache
+
+BACKENDS = {
+    "locmem": lambda location: LocMemCache("bench", {
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    }),
+    "file": lambda location: FileBasedCache(location, {
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    }),
+    "shm": lambda location: SharedMemoryCache(
+        os.path.join(location, "shm.cache"),
+        {"OPTIONS": {"MAX_ENTRIES": 20000, "SIZE": 256 * 1024 * 1024}},
+    ),
+}
+
+
+def work(backend, location, keys, operations, value_size, seed, results):
+    """Читает ключи по закону Ципфа, на промахе записывает страницу."""
+    cache = BACKENDS[backend](location)
+    value = os.urandom(value_size)
+    weights = [1 / rank for rank in range(1, keys + 1)]
+    choices = random.Random(seed).choices(
+        range(keys), weights=weights, k=operations
+    )
+    hits = 0
+    started = time.perf_counter()
+    for key in choices:
+        if cache.get(f"page:{key}") is None:
+            cache.set(f"page:{key}", value, 300)
+        else:
+            hits += 1
+    results.put((hits, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает кэш в общей памяти с LocMem и файловым кэшем: "
+        "несколько процессов читают страницы с распределением Ципфа "
+        "и записывают их на промахе, как воркеры с cache_page."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, nargs="+",
+                            default=[1, 4])
+        parser.add_argument("--keys", type=int, default=2000)
+        parser.add_argument("--operations", type=int, default=20000,
+                            help="Операций на один процесс.")
+        parser.add_argument("--value-size", type=int, default=20 * 1024,
+                            help="Размер значения в байтах.")
+        parser.add_argument("--backends", nargs="+", default=list(BACKENDS),
+                            choices=list(BACKENDS))
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context("fork")
+        self.stdout.write("backend  workers  ops/s total  hit rate  us/op")
+        for backend in options["backends"]:
+            for workers in options["workers"]:
+                with tempfile.TemporaryDirectory() as location:
+                    results = context.Queue()
+                    processes = [
+                        context.Process(target=work, args=(
+                            backend, location, options["keys"],
+                            options["operations"], options["value_size"],
+                            seed, results,
+                        ))
+                        for seed in range(workers)
+                    ]
+                    for process in processes:
+                        process.start()
+                    rows = [results.get() for _ in processes]
+                    for process in processes:
+                        process.join()
+                hits = sum(row[0] for row in rows)
+                elapsed = max(row[1] for row in rows)
+                total = options["operations"] * workers
+                self.stdout.write(
+                    "{:<7}  {:>7}  {:>11.0f}  {:>8.1%}  {:>5.1f}".format(
+                        backend, workers, total / elapsed, hits / total,
+                        sum(row[1] for row in rows) / total * 1e6,
+                    )
+                )
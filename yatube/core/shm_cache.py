@@ -0,0 +1,382 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import stat
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b"YTSHM001"
+# magic, число слотов, размер области данных, занято в ней, часы LRU,
+# непустых слотов (с удалёнными), живых записей.
+HEADER = struct.Struct("<8sIQQQII")
+# хэш ключа, смещение данных, длина ключа, длина значения,
+# срок жизни (0 - бессрочно), время последнего чтения по часам LRU.
+SLOT = struct.Struct("<QQIIdQ")
+header_size: int = 64
+EMPTY = 0
+DELETED = 1
+
+default_size: int = 64 * 1024 * 1024
+# Доля непустых слотов, после которой таблица перестраивается.
+max_fill: float = 0.75
+# При вытеснении освобождается чуть больше нужного, чтобы не
+# вытеснять и не сжимать данные на каждой записи.
+evict_headroom: float = 0.1
+
+
+def key_hash(key):
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return max(int.from_bytes(digest, "little"), DELETED + 1)
+
+
+class SharedFile:
+    """Открытый файл кэша, один на процесс.
+
+    После fork дескриптор общий с родителем, и flock не разделил бы
+    процессы: в каждом процессе файл открывается заново.
+    """
+
+    def __init__(self, path, slots, data_size):
+        fd = open_private(path)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            if header[:len(MAGIC)] != MAGIC:
+                initialize(fd, slots, data_size)
+            header = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+            self.slots, self.data_size = header[1:3]
+            self.map = mmap.mmap(
+                fd, header_size + self.slots * SLOT.size + self.data_size
+            )
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self.fd = fd
+        self.pid = os.getpid()
+        # flock одного дескриптора не разделяет потоки процесса.
+        self.lock = threading.Lock()
+
+    def close(self):
+        """Закрывает унаследованную от родителя копию."""
+        self.map.close()
+        os.close(self.fd)
+
+
+def open_private(path):
+    """Открывает файл кэша, только если его никто другой не подменил.
+
+    Из файла читаются pickle, поэтому каталог должен принадлежать
+    пользователю процесса и быть закрыт на запись для остальных, а
+    файл - принадлежать ему же и быть закрыт для остальных совсем.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o022
+    ):
+        raise ImproperlyConfigured(
+            f"Каталог кэша {directory} должен быть закрытым каталогом "
+            f"пользователя {os.getuid()}"
+        )
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    info = os.fstat(fd)
+    if (
+        not stat.S_ISREG(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        os.close(fd)
+        raise ImproperlyConfigured(
+            f"Файл кэша {path} должен принадлежать пользователю "
+            f"{os.getuid()} и быть закрыт для остальных"
+        )
+    return fd
+
+
+def initialize(fd, slots, data_size):
+    os.ftruncate(fd, 0)
+    os.ftruncate(fd, header_size + slots * SLOT.size + data_size)
+    os.pwrite(fd, HEADER.pack(MAGIC, slots, data_size, 0, 0, 0, 0), 0)
+
+
+_files = {}
+_files_lock = threading.Lock()
+
+
+class SharedMemoryCache(BaseCache):
+    """Кэш в файле, отображённом в память, общий для процессов хоста.
+
+    Файл LOCATION - хэш-таблица с открытой адресацией и область
+    данных, куда записи дописываются подряд. Когда место или слоты
+    кончаются, вытесняются давно не читанные записи (LRU по общим
+    часам), а живые сдвигаются к началу. Каждая операция идёт под
+    flock файла, поэтому incr и add атомарны между процессами.
+
+    OPTIONS: SIZE - размер области данных в байтах, MAX_ENTRIES -
+    сколько записей держать (слотов вдвое больше).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = location
+        self._data_size = int(options.get("SIZE", default_size))
+        self._slots = self._max_entries * 2
+        self._file = None
+
+    def _open(self):
+        if self._file is not None and self._file.pid == os.getpid():
+            return
+        # Django создаёт экземпляр кэша на каждый поток: файл, его
+        # отображение и блокировка потоков общие для процесса.
+        with _files_lock:
+            shared = _files.get(self._path)
+            if shared is None or shared.pid != os.getpid():
+                if shared is not None:
+                    shared.close()
+                shared = _files[self._path] = SharedFile(
+                    self._path, self._slots, self._data_size
+                )
+        self._file = shared
+        self._slots, self._data_size = shared.slots, shared.data_size
+        self._max_entries = self._slots // 2
+        self._table = header_size
+        self._data = header_size + self._slots * SLOT.size
+        self._map = shared.map
+
+    @contextmanager
+    def _locked(self):
+        self._open()
+        with self._file.lock:
+            fcntl.flock(self._file.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._file.fd, fcntl.LOCK_UN)
+
+    def _header(self):
+        return list(HEADER.unpack_from(self._map, 0)[3:])
+
+    def _write_header(self, used, clock, filled, live):
+        HEADER.pack_into(
+            self._map, 0, MAGIC, self._slots, self._data_size,
+            used, clock, filled, live,
+        )
+
+    def _slot(self, index):
+        return SLOT.unpack_from(self._map, self._table + index * SLOT.size)
+
+    def _write_slot(self, index, *fields):
+        SLOT.pack_into(self._map, self._table + index * SLOT.size, *fields)
+
+    def _find(self, key):
+        """Слот с ключом или None и первый слот, куда его можно записать."""
+        hashed = key_hash(key)
+        index = hashed % self._slots
+        free = None
+        for _ in range(self._slots):
+            slot_hash, offset, key_len = self._slot(index)[:3]
+            if slot_hash == EMPTY:
+                return None, index if free is None else free
+            if slot_hash == DELETED:
+                free = index if free is None else free
+            elif slot_hash == hashed and key_len == len(key):
+                start = self._data + offset
+                if self._map[start:start + key_len] == key:
+                    return index, free
+            index = (index + 1) % self._slots
+        return None, free
+
+    def _read(self, key, touch=True):
+        """Значение записи в байтах или None; просроченная удаляется."""
+        index, _ = self._find(key)
+        if index is None:
+            return None
+        slot_hash, offset, key_len, value_len, expires, _ = self._slot(index)
+        if expires and expires <= time.time():
+            self._remove(index)
+            return None
+        if touch:
+            used, clock, filled, live = self._header()
+            self._write_header(used, clock + 1, filled, live)
+            self._write_slot(
+                index, slot_hash, offset, key_len, value_len, expires,
+                clock + 1,
+            )
+        start = self._data + offset + key_len
+        return self._map[start:start + value_len]
+
+    def _remove(self, index):
+        self._write_slot(index, DELETED, 0, 0, 0, 0, 0)
+        used, clock, filled, live = self._header()
+        self._write_header(used, clock, filled, live - 1)
+
+    def _store(self, key, value, expires):
+        index, _ = self._find(key)
+        if index is not None:
+            self._remove(index)
+        need = len(key) + len(value)
+        if need > self._data_size:
+            return False
+        used, clock, filled, live = self._header()
+        if (
+            used + need > self._data_size
+            or live >= self._max_entries
+            or filled >= self._slots * max_fill
+        ):
+            self._make_room(need)
+            used, clock, filled, live = self._header()
+        _, target = self._find(key)
+        was_empty = self._slot(target)[0] == EMPTY
+        start = self._data + used
+        self._map[start:start + need] = key + value
+        self._write_slot(
+            target, key_hash(key), used, len(key), len(value), expires,
+            clock + 1,
+        )
+        self._write_header(
+            used + need, clock + 1, filled + was_empty, live + 1
+        )
+        return True
+
+    def _make_room(self, need):
+        """Вытесняет давно не читанные записи и сдвигает живые к началу
+        области данных; заодно таблица очищается от удалённых слотов.
+        """
+        now = time.time()
+        entries = []
+        for index in range(self._slots):
+            entry = self._slot(index)
+            if entry[0] > DELETED and not (entry[4] and entry[4] <= now):
+                entries.append(entry)
+        entries.sort(key=lambda entry: entry[5])
+        room = self._data_size * (1 - evict_headroom) - need
+        count = self._max_entries * (1 - evict_headroom) - 1
+        total = sum(entry[2] + entry[3] for entry in entries)
+        evicted = 0
+        while evicted < len(entries) and (
+            total > room or len(entries) - evicted > count
+        ):
+            total -= entries[evicted][2] + entries[evicted][3]
+            evicted += 1
+        entries = sorted(entries[evicted:], key=lambda entry: entry[1])
+        self._map[self._table:self._data] = bytes(self._data - self._table)
+        used = 0
+        for slot_hash, offset, key_len, value_len, expires, access in entries:
+            length = key_len + value_len
+            if offset != used:
+                self._map.move(
+                    self._data + used, self._data + offset, length
+                )
+            index = slot_hash % self._slots
+            while self._slot(index)[0] != EMPTY:
+                index = (index + 1) % self._slots
+            self._write_slot(
+                index, slot_hash, used, key_len, value_len, expires, access
+            )
+            used += length
+        clock = self._header()[1]
+        self._write_header(used, clock, len(entries), len(entries))
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key.encode()
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout) or 0
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._locked():
+            if self._read(key, touch=False) is not None:
+                return False
+            return self._store(key, value, self._expires(timeout))
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            value = self._read(key)
+        return default if value is None else pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        with self._locked():
+            for key in keys:
+                value = self._read(self._key(key, version))
+                if value is not None:
+                    found[key] = value
+        return {key: pickle.loads(value) for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._locked():
+            self._store(key, value, self._expires(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        values = {
+            self._key(key, version): pickle.dumps(
+                value, pickle.HIGHEST_PROTOCOL
+            )
+            for key, value in data.items()
+        }
+        expires = self._expires(timeout)
+        with self._locked():
+            stored = [
+                self._store(key, value, expires)
+                for key, value in values.items()
+            ]
+        return [key for key, ok in zip(data, stored) if not ok]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            if self._read(key, touch=False) is None:
+                return False
+            index, _ = self._find(key)
+            entry = list(self._slot(index))
+            entry[4] = self._expires(timeout)
+            self._write_slot(index, *entry)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            value = self._read(key, touch=False)
+            if value is None:
+                raise ValueError(f"Key '{key.decode()}' not found")
+            index, _ = self._find(key)
+            expires = self._slot(index)[4]
+            new_value = pickle.loads(value) + delta
+            self._store(
+                key, pickle.dumps(new_value, pickle.HIGHEST_PROTOCOL), expires
+            )
+        return new_value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            return self._read(key, touch=False) is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._locked():
+            index, _ = self._find(key)
+            if index is not None:
+                self._remove(index)
+
+    def clear(self):
+        with self._locked():
+            self._map[self._table:self._data] = bytes(self._data - self._table)
+            self._write_header(0, self._header()[1], 0, 0)
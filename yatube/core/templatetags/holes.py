@@ -0,0 +1,10 @@
+from django import template
+
+from core.holes import punch
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **kwargs):
+    return punch(context["request"], name, **kwargs)
@@ -1,5 +1,18 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import tempfile
+import threading
 from http import HTTPStatus
+from time import monotonic, sleep, time
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from . import bus
+from .shm_cache import SharedMemoryCache
+from .tiered_cache import TieredCache
 
 
 class ViewTestClass(TestCase):
@@ -7,3 +20,232 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, "core/404.html")
+
+
+def increment(location, times):
+    cache = SharedMemoryCache(location, {})
+    for _ in range(times):
+        cache.incr("counter")
+
+
+class SharedMemoryCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, "cache")
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        options.setdefault("MAX_ENTRIES", 10)
+        options.setdefault("SIZE", 64 * 1024)
+        return SharedMemoryCache(self.location, {"OPTIONS": options})
+
+    def test_set_get_delete(self):
+        """Запись читается другим экземпляром и удаляется"""
+        self.cache.set("key", {"value": [1, 2]})
+        self.assertEqual(self.make_cache().get("key"), {"value": [1, 2]})
+        self.assertFalse(self.cache.add("key", "other"))
+        self.cache.delete("key")
+        self.assertIsNone(self.make_cache().get("key"))
+        self.assertTrue(self.cache.add("key", "other"))
+
+    def test_ttl(self):
+        """Просроченная запись не читается"""
+        self.cache.set("key", "value", 10)
+        self.cache.set("forever", "value", None)
+        with mock.patch("core.shm_cache.time.time", return_value=time() + 60):
+            self.assertIsNone(self.cache.get("key"))
+            self.assertEqual(self.cache.get("forever"), "value")
+
+    def test_lru_eviction_by_entries(self):
+        """При нехватке слотов вытесняются давно не читанные записи"""
+        for number in range(10):
+            self.cache.set(f"key{number}", number)
+        self.cache.get("key0")
+        self.cache.set("new", "value")
+        self.assertEqual(self.cache.get("key0"), 0)
+        self.assertIsNone(self.cache.get("key1"))
+        self.assertEqual(self.cache.get("new"), "value")
+
+    def test_lru_eviction_by_size(self):
+        """При нехватке места данные вытесняются и сжимаются"""
+        cache = self.make_cache(MAX_ENTRIES=100, SIZE=8 * 1024)
+        for number in range(20):
+            cache.set(f"key{number}", bytes(1024))
+            cache.get("key0")
+        self.assertEqual(cache.get("key0"), bytes(1024))
+        self.assertEqual(cache.get("key19"), bytes(1024))
+        self.assertIsNone(cache.get("key1"))
+        self.assertEqual(
+            cache.set_many({"huge": bytes(16 * 1024)}), ["huge"]
+        )
+
+    def test_threads_share_one_descriptor(self):
+        """Экземпляры кэша в потоках не открывают файл заново"""
+        self.cache.set("key", "value")
+        before = len(os.listdir("/proc/self/fd"))
+
+        def read():
+            self.assertEqual(self.make_cache().get("key"), "value")
+
+        threads = [threading.Thread(target=read) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(os.listdir("/proc/self/fd")), before)
+
+    def test_rejects_shared_directory(self):
+        """Файл в каталоге, открытом на запись другим, не открывается"""
+        os.chmod(os.path.dirname(self.location), 0o777)
+        with self.assertRaises(ImproperlyConfigured):
+            self.cache.get("key")
+
+    def test_rejects_symlink(self):
+        """Подложенная вместо файла ссылка не открывается"""
+        target = f"{self.location}.target"
+        os.symlink(target, self.location)
+        with self.assertRaises(OSError):
+            self.cache.get("key")
+        self.assertFalse(os.path.exists(target))
+
+    def test_incr_is_atomic_across_processes(self):
+        """incr из нескольких процессов не теряет обновлений"""
+        self.cache.set("counter", 0)
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=increment, args=(self.location, 200))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get("counter"), 800)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = TieredCache("tiered-test", {
+            "OPTIONS": {"SHARED": "shared", "LOCAL_MAX_ENTRIES": 2},
+        })
+        self.cache.clear()
+        self.shared = caches["shared"]
+
+    def test_local_hit_skips_shared_cache(self):
+        """Повторное чтение берётся из памяти процесса"""
+        self.cache.set("key", "value")
+        before = self.cache.stats()
+        with mock.patch.object(type(self.shared), "get") as shared_get:
+            self.assertEqual(self.cache.get("key"), "value")
+        shared_get.assert_not_called()
+        self.assertEqual(
+            self.cache.stats()["local_hits"], before["local_hits"] + 1
+        )
+
+    def test_local_copy_expires(self):
+        """Запись другого процесса видна после LOCAL_TIMEOUT"""
+        self.cache.set("key", "old")
+        self.shared.set("key", "new")
+        self.assertEqual(self.cache.get("key"), "old")
+        later = monotonic() + 60
+        with mock.patch("core.tiered_cache.time.monotonic",
+                        return_value=later):
+            self.assertEqual(self.cache.get("key"), "new")
+        stats = self.cache.stats()
+        self.assertGreaterEqual(stats["shared_hits"], 1)
+
+    def test_local_tier_is_bounded(self):
+        """Локальный уровень вытесняет давно не читанные ключи"""
+        for key in ("a", "b", "c"):
+            self.cache.set(key, key)
+        self.shared.delete("a")
+        self.shared.delete("b")
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), "b")
+
+    def test_generations_are_read_from_shared_cache(self):
+        """Поколения не кэшируются локально: инвалидация видна сразу"""
+        self.cache.set("generation:index", 1)
+        self.cache.get("generation:index")
+        self.shared.incr("generation:index")
+        self.assertEqual(self.cache.get("generation:index"), 2)
+
+    def test_local_copy_is_not_shared_object(self):
+        """Изменение прочитанного значения не портит кэш"""
+        self.cache.set("key", {"items": []})
+        self.cache.get("key")["items"].append(1)
+        self.assertEqual(self.cache.get("key"), {"items": []})
+
+
+def listen_for(queue, poll_timeout):
+    bus.subscribe(lambda keys, tags: queue.put((keys, tags)))
+    with mock.patch("core.bus.poll_timeout", poll_timeout), \
+            mock.patch("core.bus.retry_delay", poll_timeout), \
+            mock.patch("core.bus.logger"):
+        bus.listen()
+        sleep(30)
+
+
+class InvalidationBusTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(INVALIDATION_BUS_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.context = multiprocessing.get_context("fork")
+        self.queue = self.context.Queue()
+
+    def start_listener(self, poll_timeout=1):
+        listener = self.context.Process(
+            target=listen_for, args=(self.queue, poll_timeout), daemon=True
+        )
+        listener.start()
+        self.addCleanup(listener.terminate)
+        self.wait_for_socket(listener.pid)
+        return listener
+
+    def wait_for_socket(self, pid):
+        deadline = monotonic() + 5
+        while not os.path.exists(bus.socket_path(pid)):
+            self.assertLess(monotonic(), deadline)
+            sleep(0.01)
+
+    def test_other_process_receives_invalidation(self):
+        """Ключи и теги доходят до другого процесса"""
+        self.start_listener()
+        bus.publish(keys=["key"], tags=["group:cats"], local=False)
+        received = [self.queue.get(timeout=5) for _ in range(2)]
+        self.assertCountEqual(
+            received, [([], ["group:cats"]), (["key"], [])]
+        )
+
+    def test_listener_rebinds_removed_socket(self):
+        """Слушатель заново создаёт удалённый файл сокета"""
+        listener = self.start_listener(poll_timeout=0.05)
+        os.unlink(bus.socket_path(listener.pid))
+        self.wait_for_socket(listener.pid)
+        bus.publish(tags=["index"], local=False)
+        self.assertEqual(self.queue.get(timeout=5), ([], ["index"]))
+
+    def test_dead_process_socket_is_removed(self):
+        """Сокет умершего процесса удаляется при рассылке"""
+        listener = self.start_listener()
+        listener.kill()
+        listener.join()
+        bus.publish(tags=["index"], local=False)
+        self.assertFalse(os.path.exists(bus.socket_path(listener.pid)))
+
+    def test_tag_drops_local_copies(self):
+        """Тег сбрасывает локальные копии ключей своей области"""
+        cache = TieredCache("bus-test", {"OPTIONS": {"SHARED": "shared"}})
+        cache.set("group:cats:page:1", "cats")
+        cache.set("group:dogs:page:1", "dogs")
+        cache.set("other", "value")
+        bus.dispatch(["other"], ["group:cats"])
+        self.assertEqual(
+            list(cache._local.entries), [cache.make_key("group:dogs:page:1")]
+        )
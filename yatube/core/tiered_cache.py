@@ -0,0 +1,232 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import bus
+
+default_local_timeout: int = 5
+default_local_entries: int = 200
+# Ключи, через которые идут инвалидации и блокировки, читаются только
+# из общего кэша: поколения страниц и замки должны быть свежими.
+default_bypass = ("generation:", "lock:")
+
+
+class LocalTier:
+    """LRU в памяти процесса: ключ -> (срок, значение в pickle)."""
+
+    def __init__(self, max_entries, make_key):
+        self.max_entries = max_entries
+        self.make_key = make_key
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = dict.fromkeys(
+            ("local_hits", "local_misses", "shared_hits", "shared_misses"), 0
+        )
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.stats["local_misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["local_hits"] += 1
+            return entry[1]
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def drop(self, keys, tags):
+        """Удаляет ключи и все ключи, начинающиеся с "<тег>:"."""
+        keys = {self.make_key(key) for key in keys}
+        prefixes = tuple(self.make_key(f"{tag}:") for tag in tags)
+        with self.lock:
+            for key in [
+                key for key in self.entries
+                if key in keys or prefixes and key.startswith(prefixes)
+            ]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def count(self, hit):
+        with self.lock:
+            self.stats["shared_hits" if hit else "shared_misses"] += 1
+
+
+# Django создаёт экземпляр кэша на каждый поток, а локальный уровень
+# общий для процесса: он хранится здесь по имени кэша.
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+@bus.subscribe
+def drop_local_copies(keys, tags):
+    for tier in list(_tiers.values()):
+        tier.drop(keys, tags)
+
+
+class TieredCache(BaseCache):
+    """Небольшой LRU в памяти процесса перед общим кэшем Django.
+
+    Горячие ключи читаются без похода в общий кэш, но не дольше
+    LOCAL_TIMEOUT секунд: дольше локальная копия не отстаёт от
+    записей других процессов. Обычно и меньше: запись и удаление
+    ключа рассылаются по шине инвалидации (core.bus), и другие
+    процессы сразу забывают свою копию. Страницы хранятся под ключами с
+    поколением (posts.cache), так что после bump_generations ключ
+    меняется и локальная копия просто перестаёт читаться; сами
+    поколения и блокировки (BYPASS) локально не кэшируются.
+
+    OPTIONS: SHARED - имя общего кэша в CACHES, LOCAL_TIMEOUT,
+    LOCAL_MAX_ENTRIES, BYPASS - префиксы ключей мимо локального уровня.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options["SHARED"]
+        self._local_timeout = options.get(
+            "LOCAL_TIMEOUT", default_local_timeout
+        )
+        self._bypass = tuple(options.get("BYPASS", default_bypass))
+        with _tiers_lock:
+            self._local = _tiers.setdefault(name, LocalTier(
+                options.get("LOCAL_MAX_ENTRIES", default_local_entries),
+                self.make_key,
+            ))
+
+    @property
+    def _shared(self):
+        return caches[self._shared_alias]
+
+    def _local_key(self, key, version):
+        if key.startswith(self._bypass):
+            return None
+        return self.make_key(key, version=version)
+
+    def _remember(self, local_key, value, timeout):
+        timeout = self._local_timeout if timeout in (
+            DEFAULT_TIMEOUT, None
+        ) else min(timeout, self._local_timeout)
+        if local_key is not None and timeout > 0:
+            self._local.set(
+                local_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                timeout,
+            )
+
+    def stats(self):
+        """Попадания и промахи обоих уровней в этом процессе."""
+        with self._local.lock:
+            return dict(self._local.stats)
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            value = self._local.get(local_key)
+            if value is not None:
+                return pickle.loads(value)
+        value = self._shared.get(key, version=version)
+        self._local.count(value is not None)
+        if value is None:
+            return default
+        self._remember(local_key, value, self._local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        for key in keys:
+            local_key = self._local_key(key, version)
+            value = self._local.get(local_key) if local_key else None
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(value)
+        if missing:
+            shared = self._shared.get_many(missing, version=version)
+            for key in missing:
+                self._local.count(key in shared)
+                if key in shared:
+                    self._remember(
+                        self._local_key(key, version), shared[key],
+                        self._local_timeout,
+                    )
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._shared.set(key, value, timeout, version=version)
+        self._remember(self._local_key(key, version), value, timeout)
+        self._announce([key], version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(self._local_key(key, version), value, timeout)
+        self._announce(data, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._forget(key, version)
+        added = self._shared.add(key, value, timeout, version=version)
+        if added:
+            self._announce([key], version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._forget(key, version)
+        value = self._shared.incr(key, delta, version=version)
+        self._announce([key], version)
+        return value
+
+    def delete(self, key, version=None):
+        self._forget(key, version)
+        deleted = self._shared.delete(key, version=version)
+        self._announce([key], version)
+        return deleted
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def clear(self):
+        self._local.clear()
+        self._shared.clear()
+
+    def _announce(self, keys, version):
+        """Просит другие процессы забыть свои копии ключей.
+
+        По шине ходят ключи без версии: ключи с явной версией остаются
+        в чужих процессах до LOCAL_TIMEOUT.
+        """
+        keys = [
+            key for key in keys
+            if self._local_key(key, version) is not None
+        ]
+        if keys and version is None:
+            bus.publish(keys=keys, local=False)
+
+    def _forget(self, key, version):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self._local.delete(local_key)
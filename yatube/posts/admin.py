@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import Group, Post, Follow, Comment
+from .models import Group, Post, PostImage, Follow, Comment
+from .paginator import EstimatedCountPaginator
+from .search import filter_posts
+
+
+class PostImageInline(admin.TabularInline):
+    model = PostImage
+    fields = ("image", "position")
+    extra = 0
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -8,6 +16,25 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
     list_editable = ("group",)
+    list_select_related = ("author", "group")
+    inlines = (PostImageInline,)
+    paginator = EstimatedCountPaginator
+    # Без второго COUNT(*) по всей таблице рядом с отфильтрованным.
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по text идёт через полнотекстовый индекс, а не LIKE."""
+        return filter_posts(queryset, search_term), False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Поле создаётся один раз для класса формы list_editable и
+        # копируется в каждую строку. Готовый список групп копируется
+        # вместе с ним, а queryset читался бы заново в каждой строке.
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if db_field.name == "group":
+            # Не list(): он спрашивает len() и делает лишний COUNT(*).
+            field.choices = [choice for choice in field.choices]
+        return field
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,80 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .cache import get_generations, now_and_on_commit
+from .images import attach_gallery, attach_thumbnails
+from .models import Post
+
+article_timeout: int = 60 * 60 * 24
+
+
+def article_key(post_id, updated, generation):
+    """Ключ карточки: id поста и время его последнего изменения.
+
+    Ключ начинается с тега поста "post:<id>", так что все версии
+    карточки сбрасываются тегом по шине инвалидации.
+    """
+    updated = int(updated.timestamp() * 1000000)
+    return f"post:{post_id}:article:{generation}:{updated}"
+
+
+def forget_article(post_id, updated):
+    """Удаляет карточку устаревшей версии поста."""
+    generation, = get_generations(["articles"])
+    now_and_on_commit(
+        cache.delete, article_key(post_id, updated, generation)
+    )
+
+
+def load_texts(posts):
+    """Догружает отложенный text всех постов одним запросом."""
+    posts = [
+        post for post in posts if "text" in post.get_deferred_fields()
+    ]
+    if not posts:
+        return
+    texts = dict(
+        Post.objects.filter(
+            id__in=[post.id for post in posts]
+        ).order_by().values_list("id", "text")
+    )
+    for post in posts:
+        post.text = texts.get(post.id, "")
+
+
+def has_pending_pictures(post):
+    """Вместо вариантов картинок пока оригиналы: карточку не кэшируем."""
+    return any(
+        item.thumbnail and item.thumbnail.get("pending")
+        for item in [post, *post.gallery_images]
+    )
+
+
+def attach_articles(posts):
+    """Кладёт в post.article_html отрендеренную карточку includes/article.html.
+
+    Карточки всей страницы читаются одним get_many, недостающие
+    рендерятся и записываются одним set_many. Карточки общие для
+    главной, групп, профилей и ленты подписок.
+    """
+    generation, = get_generations(["articles"])
+    keys = {
+        article_key(post.id, post.updated, generation): post
+        for post in posts
+    }
+    found = cache.get_many(keys)
+    stale = [post for key, post in keys.items() if key not in found]
+    load_texts(stale)
+    attach_thumbnails(stale + attach_gallery(stale))
+    missing = {}
+    for key, post in keys.items():
+        html = found.get(key)
+        if html is None:
+            html = render_to_string("includes/article.html", {"post": post})
+            if not has_pending_pictures(post):
+                missing[key] = html
+        post.article_html = mark_safe(html)
+    if missing:
+        cache.set_many(missing, article_timeout)
+    return posts
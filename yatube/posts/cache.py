@@ -0,0 +1,254 @@
+import hashlib
+import logging
+import math
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, SuspiciousOperation
+from django.db import transaction
+from django.http import Http404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from core import bus
+from core.holes import fill_holes
+
+logger = logging.getLogger(__name__)
+
+# Сколько после срока отдаётся устаревшая копия, пока идёт пересборка.
+page_stale_timeout: int = 60 * 60 * 24
+page_lock_timeout: int = 30
+# Без копии остальные запросы ждут сборки не дольше этого.
+page_wait_timeout: float = 5
+page_wait_step: float = 0.05
+# Насколько раньше срока обновляются долгие страницы (XFetch).
+early_expiry_beta: float = 1.0
+# Столько живёт копия страницы, собранной не до конца, например
+# с оригиналами картинок вместо ещё не готовых миниатюр.
+incomplete_page_timeout: int = 10
+
+_page_incomplete = ContextVar("page_incomplete", default=False)
+
+# Исключения, которые Django превращает в 4xx: это ответ, а не сбой,
+# и устаревшая копия вместо них не отдаётся.
+client_errors = (Http404, PermissionDenied, SuspiciousOperation)
+
+
+def generation_key(scope):
+    return f"generation:{quote(scope, safe=':')}"
+
+
+def new_generation():
+    """Начальное поколение зависит от времени, чтобы после вытеснения
+    счётчика из кэша не совпасть со старыми закэшированными страницами.
+    """
+    return time.time_ns() // 1000
+
+
+def get_generations(scopes):
+    """Текущие поколения областей кэша одним запросом get_many."""
+    keys = [generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, new_generation(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump_generations(*scopes):
+    """Сбрасывает все страницы указанных областей.
+
+    Область рассылается и тегом по шине инвалидации: процессы сразу
+    выбрасывают свои локальные копии её страниц. Внутри транзакции
+    сброс повторяется после коммита (см. now_and_on_commit).
+    """
+    now_and_on_commit(increment_generations, set(scopes))
+
+
+def increment_generations(scopes):
+    for scope in scopes:
+        key = generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_generation(), None)
+    bus.publish(tags=scopes)
+
+
+def now_and_on_commit(func, *args, **kwargs):
+    """Вызывает инвалидацию сразу и, внутри транзакции, ещё раз после
+    коммита.
+
+    Между ними параллельный запрос может пересобрать страницу по
+    данным до коммита и сохранить её с уже новым поколением; второй
+    вызов сбрасывает такую копию. Первый нужен, чтобы изменения были
+    видны в этой же транзакции.
+    """
+    func(*args, **kwargs)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: func(*args, **kwargs))
+
+
+def page_key(scope, key_prefix, request):
+    """Ключ копии страницы начинается с области: "<scope>:page:..."."""
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"{scope}:page:{key_prefix}:{url}"
+
+
+def is_fresh(entry, generation):
+    """Копия свежая, если поколение не сменилось и срок не подошёл.
+
+    Срок сдвигается на случайную величину, пропорциональную времени
+    сборки страницы (XFetch): чем дольше собирается страница, тем
+    раньше одна из копий обновится до истечения срока.
+    """
+    if entry["generation"] != generation:
+        return False
+    early = -entry["delta"] * early_expiry_beta * math.log(
+        1 - random.random()
+    )
+    return time.time() + early < entry["expires"]
+
+
+def cache_page_by_generation(timeout, key_prefix, scope,
+                             stale_timeout=page_stale_timeout):
+    """Кэш страницы с поколением области scope и отдачей устаревшей
+    копии, пока страница пересобирается.
+
+    scope - шаблон имени области, подставляются аргументы view:
+    "group:{slug}". После bump_generations копия считается устаревшей.
+    Пересобирает страницу один запрос, взявший блокировку; остальные
+    получают устаревшую копию, а без копии ждут сборки. Если view
+    падает или отвечает 5xx, отдаётся устаревшая копия
+    (stale-if-error). Копия живёт timeout + stale_timeout секунд.
+
+    Копия страницы общая для всех пользователей: персональные части
+    рендерятся тегом {% hole %} как метки и подставляются на каждый
+    запрос через fill_holes.
+    """
+    def decorator(view):
+        return wraps(view)(
+            CachedPage(view, timeout, key_prefix, scope, stale_timeout)
+        )
+    return decorator
+
+
+class CachedPage:
+    def __init__(self, view, timeout, key_prefix, scope, stale_timeout):
+        self.view = view
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.scope = scope
+        self.stale_timeout = stale_timeout
+
+    def __call__(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return self.view(request, *args, **kwargs)
+        scope = self.scope.format(**kwargs)
+        generation, = get_generations([scope])
+        key = page_key(scope, self.key_prefix, request)
+        entry = cache.get(key)
+        if entry is not None and is_fresh(entry, generation):
+            response = entry["response"]
+        else:
+            response = self.revalidate(
+                request, args, kwargs, key, generation, entry
+            )
+        return fill_holes(request, response)
+
+    def revalidate(self, request, args, kwargs, key, generation, stale):
+        lock = f"page:{key}"
+        if not acquire_lock(lock, page_lock_timeout):
+            if stale is not None:
+                return stale["response"]
+            entry = wait_for_page(key, generation)
+            if entry is not None:
+                return entry["response"]
+            return self.render(request, args, kwargs, key, generation)
+        try:
+            return self.render(request, args, kwargs, key, generation)
+        except client_errors:
+            # Страницы больше нет или она недоступна: устаревшую копию
+            # показывать нельзя.
+            cache.delete(key)
+            raise
+        except Exception as error:
+            if stale is not None:
+                logger.exception("Отдана устаревшая копия %s", key)
+                return stale["response"]
+            if isinstance(error, PageError):
+                return error.response
+            raise
+        finally:
+            release_lock(lock)
+
+    def render(self, request, args, kwargs, key, generation):
+        started = time.monotonic()
+        request.punch_holes = True
+        incomplete = _page_incomplete.set(False)
+        try:
+            response = self.view(request, *args, **kwargs)
+        finally:
+            request.punch_holes = False
+            fresh_for = (
+                incomplete_page_timeout if _page_incomplete.get()
+                else self.timeout
+            )
+            _page_incomplete.reset(incomplete)
+        if response.status_code >= 500:
+            raise PageError(response)
+        # timeout - срок серверной копии, а не браузерной: в странице
+        # персональные части, и после входа, подписки или нового поста
+        # браузер должен спросить её заново.
+        patch_cache_control(response, no_cache=True, max_age=0)
+        patch_vary_headers(response, ("Cookie",))
+        if (
+            request.method == "GET"
+            and response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+        ):
+            cache.set(key, {
+                "generation": generation,
+                "expires": time.time() + fresh_for,
+                "delta": time.monotonic() - started,
+                "response": response,
+            }, self.timeout + self.stale_timeout)
+        return response
+
+
+def mark_page_incomplete():
+    """Отмечает, что собираемая страница неокончательная."""
+    _page_incomplete.set(True)
+
+
+def wait_for_page(key, generation):
+    """Ждёт, пока страницу соберёт запрос с блокировкой."""
+    deadline = time.monotonic() + page_wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(page_wait_step)
+        entry = cache.get(key)
+        if entry is not None and entry["generation"] == generation:
+            return entry
+    return None
+
+
+class PageError(Exception):
+    """Ответ 5xx: как исключение, он не попадает в кэш."""
+
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+def acquire_lock(name, timeout):
+    """Берёт блокировку в кэше; cache.add атомарен во всех бэкендах."""
+    return cache.add(f"lock:{quote(name, safe=':')}", True, timeout)
+
+
+def release_lock(name):
+    cache.delete(f"lock:{quote(name, safe=':')}")
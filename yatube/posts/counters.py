@@ -0,0 +1,111 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Comment, Follow, Group, Post, PostImage, User, UserStats
+
+
+def count_subquery(model, field):
+    """Подзапрос COUNT(*) строк model, ссылающихся на внешнюю строку."""
+    counts = model.objects.filter(
+        **{field: OuterRef("pk")}
+    ).order_by().values(field).annotate(total=Count("pk")).values("total")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def user_counts():
+    """Пользователи с честно посчитанными значениями счётчиков."""
+    return User.objects.annotate(
+        real_posts=count_subquery(Post, "author"),
+        real_followers=count_subquery(Follow, "author"),
+        real_following=count_subquery(Follow, "user"),
+    )
+
+
+def reconcile_user(user_id):
+    """Пересчитывает счётчики пользователя и создаёт их при отсутствии."""
+    user = user_counts().filter(pk=user_id).first()
+    if user is None:
+        return None
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            "posts_count": user.real_posts,
+            "followers_count": user.real_followers,
+            "following_count": user.real_following,
+        },
+    )
+    return stats
+
+
+def get_user_stats(user_id):
+    return (
+        UserStats.objects.filter(user_id=user_id).first()
+        or reconcile_user(user_id)
+    )
+
+
+def bump_user(user_id, **deltas):
+    """Атомарно меняет счётчики пользователя на deltas.
+
+    Если строки ещё нет, она пересчитывается целиком; при уменьшении
+    отсутствие строки не страшно: пользователь может удаляться каскадом.
+    """
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        reconcile_user(user_id)
+
+
+def bump_group(group_id, delta):
+    if group_id:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=F("posts_count") + delta
+        )
+
+
+def bump_post_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F("comments_count") + delta
+    )
+
+
+def bump_post_gallery(post_id, delta):
+    # updated сдвигается, чтобы карточка поста собралась заново.
+    Post.objects.filter(pk=post_id).update(
+        gallery_count=F("gallery_count") + delta, updated=timezone.now()
+    )
+
+
+def reconcile_all():
+    """Исправляет расхождения всех счётчиков, возвращает число исправлений."""
+    fixed = {"users": 0, "posts": 0, "groups": 0}
+    stats = {s.user_id: s for s in UserStats.objects.iterator()}
+    for user in user_counts().iterator():
+        current = stats.get(user.pk)
+        real = (user.real_posts, user.real_followers, user.real_following)
+        if current is not None and real == (
+            current.posts_count,
+            current.followers_count,
+            current.following_count,
+        ):
+            continue
+        reconcile_user(user.pk)
+        fixed["users"] += 1
+    for field, model in (
+        ("comments_count", Comment), ("gallery_count", PostImage)
+    ):
+        posts = Post.objects.annotate(
+            real=count_subquery(model, "post")
+        ).exclude(**{field: F("real")}).values_list("pk", "real")
+        for pk, real in posts.iterator():
+            Post.objects.filter(pk=pk).update(**{field: real})
+            fixed["posts"] += 1
+    groups = Group.objects.annotate(
+        real=count_subquery(Post, "group")
+    ).exclude(posts_count=F("real")).values_list("pk", "real")
+    for pk, real in groups.iterator():
+        Group.objects.filter(pk=pk).update(posts_count=real)
+        fixed["groups"] += 1
+    return fixed
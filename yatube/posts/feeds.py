@@ -0,0 +1,252 @@
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .cache import acquire_lock, release_lock
+from .counters import get_user_stats
+from .models import FeedEntry, Follow, Post, UserStats, card_fields
+from .paginator import FORWARD, CursorPaginator, keyset_slice
+
+logger = logging.getLogger(__name__)
+
+batch_size: int = 500
+stop_pulling_timeout: int = 60 * 60
+
+_executor = None
+
+
+def get_fanout_threshold():
+    """Число подписчиков, выше которого посты автора не раскладываются."""
+    return settings.FEED_FANOUT_THRESHOLD
+
+
+def count_followers(author_id):
+    stats = get_user_stats(author_id)
+    return stats.followers_count if stats else 0
+
+
+def is_pulled(author_id):
+    """Посты автора читаются при запросе ленты, а не хранятся в ней."""
+    stats = get_user_stats(author_id)
+    return bool(stats and stats.feed_pulled)
+
+
+def get_pulled_authors(user):
+    """Авторы из подписок пользователя, чьи посты подтягиваются при чтении."""
+    return list(
+        UserStats.objects.filter(
+            user__following__user=user, feed_pulled=True,
+        ).values_list("user_id", flat=True)
+    )
+
+
+def start_pulling(author_id):
+    """Автор перерос порог: новые посты больше не раскладываются.
+
+    Режим записан в UserStats.feed_pulled, а не выводится из числа
+    подписчиков: так переход в обе стороны случается один раз, даже
+    если порог пересекли сразу несколькими подписками или отписками.
+    """
+    UserStats.objects.filter(
+        user_id=author_id,
+        feed_pulled=False,
+        followers_count__gt=get_fanout_threshold(),
+    ).update(feed_pulled=True)
+
+
+def sync_feed_modes():
+    """Сверяет режим лент всех авторов с текущим порогом.
+
+    Сам режим меняется только при подписке и отписке, поэтому после
+    смены FEED_FANOUT_THRESHOLD его пересчитывает reconcile_counters.
+    Возвращает, сколько авторов перешло на чтение по запросу и
+    сколько вернулось к раскладке.
+    """
+    threshold = get_fanout_threshold()
+    pulled = UserStats.objects.filter(
+        feed_pulled=False, followers_count__gt=threshold,
+    ).update(feed_pulled=True)
+    pushed = list(UserStats.objects.filter(
+        feed_pulled=True, followers_count__lte=threshold,
+    ).values_list("user_id", flat=True))
+    for author_id in pushed:
+        schedule_stop_pulling(author_id)
+    return pulled, len(pushed)
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list("user_id", flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id,
+                post_id=post.id,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту пользователя все посты нового автора."""
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list("id", "pub_date")
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts.iterator()
+        ),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+
+
+def prune_feed(user_id, author_id):
+    """Убирает из ленты пользователя посты автора после отписки."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    stats = UserStats.objects.filter(user_id=author_id).values_list(
+        "feed_pulled", "followers_count"
+    ).first()
+    if stats and stats[0] and stats[1] <= get_fanout_threshold():
+        transaction.on_commit(lambda: schedule_stop_pulling(author_id))
+
+
+def schedule_stop_pulling(author_id):
+    if settings.FEED_WORKERS:
+        get_executor().submit(_run_in_worker, author_id)
+    else:
+        stop_pulling(author_id)
+
+
+def _run_in_worker(author_id):
+    try:
+        stop_pulling(author_id)
+    except Exception:
+        logger.exception("Не удалось догрузить ленты автора %s", author_id)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.FEED_WORKERS, thread_name_prefix="feeds",
+        )
+    return _executor
+
+
+def stop_pulling(author_id):
+    """Автор опустился до порога: его посты снова раскладываются.
+
+    Написанные за время чтения "по запросу" посты догружаются в ленты
+    всех подписчиков пачками вне запроса. Пока идёт догрузка, посты
+    по-прежнему подтягиваются при чтении; посты, написанные за это
+    время, догружаются вторым проходом после смены режима.
+    """
+    lock = f"feed-mode:{author_id}"
+    if not acquire_lock(lock, stop_pulling_timeout):
+        return
+    try:
+        if not UserStats.objects.filter(
+            user_id=author_id,
+            feed_pulled=True,
+            followers_count__lte=get_fanout_threshold(),
+        ).exists():
+            return
+        started = timezone.now()
+        backfill_followers(author_id, Post.objects.filter(author_id=author_id))
+        UserStats.objects.filter(user_id=author_id).update(feed_pulled=False)
+        backfill_followers(author_id, Post.objects.filter(
+            author_id=author_id, pub_date__gte=started
+        ))
+    finally:
+        release_lock(lock)
+
+
+def backfill_followers(author_id, posts):
+    """Кладёт посты в ленты всех подписчиков, по batch_size подписчиков."""
+    posts = list(posts.values_list("id", "pub_date"))
+    followers = Follow.objects.filter(author_id=author_id).order_by(
+        "user_id"
+    ).values_list("user_id", flat=True)
+    last = 0
+    while posts:
+        chunk = list(followers.filter(user_id__gt=last)[:batch_size])
+        if not chunk:
+            return
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for user_id in chunk
+                for post_id, pub_date in posts
+            ),
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        last = chunk[-1]
+
+
+class FeedPaginator(CursorPaginator):
+    """Лента подписок: готовые записи FeedEntry плюс посты популярных
+    авторов, слитые k-way merge по (pub_date, id) при чтении.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(
+            FeedEntry.objects.filter(user=user).select_related(
+                "post__author", "post__group"
+            ).only("pub_date", "post_id", *card_fields("post__")),
+            per_page,
+        )
+        self.pulled_authors = get_pulled_authors(user)
+
+    def fetch(self, position, direction, limit):
+        entries = keyset_slice(
+            self.object_list, position, direction, limit,
+            key_field="post_id",
+        )
+        streams = [[entry.post for entry in entries]]
+        for author_id in self.pulled_authors:
+            posts = Post.objects.filter(author_id=author_id).for_cards()
+            streams.append(keyset_slice(posts, position, direction, limit))
+        merged = heapq.merge(
+            *streams,
+            key=lambda post: (post.pub_date, post.id),
+            reverse=direction == FORWARD,
+        )
+        rows, seen = [], set()
+        for post in merged:
+            if post.id in seen:
+                continue
+            seen.add(post.id)
+            rows.append(post)
+            if len(rows) == limit:
+                break
+        return rows
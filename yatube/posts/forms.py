@@ -1,9 +1,34 @@
-from .models import Post, Comment
+from .models import Post, PostImage, Comment
+from .uploads import strip_exif
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db.models import Max
 from django.forms import ModelForm
 from django.utils.translation import gettext_lazy as _
 
 
-class PostForm(ModelForm):
+class UploadErrorsMixin:
+    """Показывает ошибки, найденные ImageUploadHandler при загрузке."""
+
+    def __init__(self, *args, upload_errors=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.upload_errors = upload_errors or {}
+
+    def clean(self):
+        for field, message in self.upload_errors.items():
+            if field in self.fields:
+                self.add_error(field, message)
+        return super().clean()
+
+
+class PostForm(UploadErrorsMixin, ModelForm):
+    def clean_image(self):
+        image = self.cleaned_data["image"]
+        if isinstance(image, UploadedFile):
+            return strip_exif(image)
+        return image
+
     class Meta:
         model = Post
         fields = ("text", "group", "image")
@@ -17,6 +42,43 @@ class PostForm(ModelForm):
         }
 
 
+class GalleryForm(UploadErrorsMixin, forms.Form):
+    gallery = forms.FileField(
+        label=_("Галерея"),
+        help_text=_("Дополнительные картинки, можно выбрать несколько"),
+        required=False,
+        widget=forms.ClearableFileInput(attrs={"multiple": True}),
+    )
+
+    def clean_gallery(self):
+        name = self.add_prefix("gallery")
+        if hasattr(self.files, "getlist"):
+            files = self.files.getlist(name)
+        else:
+            files = [self.files[name]] if name in self.files else []
+        if len(files) > settings.MAX_GALLERY_IMAGES:
+            raise forms.ValidationError(
+                _("Не больше %(limit)s картинок в галерее."),
+                params={"limit": settings.MAX_GALLERY_IMAGES},
+            )
+        field = forms.ImageField()
+        return [strip_exif(field.clean(file)) for file in files]
+
+    def save(self, post):
+        """Добавляет загруженные картинки в конец галереи поста."""
+        images = self.cleaned_data["gallery"]
+        if not images:
+            return []
+        last = post.gallery.aggregate(last=Max("position"))["last"]
+        start = -1 if last is None else last
+        return [
+            PostImage.objects.create(
+                post=post, image=image, position=start + number
+            )
+            for number, image in enumerate(images, 1)
+        ]
+
+
 class CommentForm(ModelForm):
     class Meta:
         model = Comment
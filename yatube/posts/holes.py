@@ -0,0 +1,30 @@
+from django.template.loader import render_to_string
+
+from core.holes import fragment
+
+from .models import Follow
+
+
+@fragment("switcher")
+def switcher(request, active=""):
+    return render_to_string(
+        "posts/includes/switcher.html", {active: True}, request=request
+    )
+
+
+@fragment("follow_button")
+def follow_button(request, username):
+    is_author = request.user.username == username
+    following = request.user.is_authenticated and not is_author and (
+        Follow.objects.filter(
+            user=request.user, author__username=username
+        ).exists()
+    )
+    context = {
+        "username": username,
+        "is_author": is_author,
+        "following": following,
+    }
+    return render_to_string(
+        "posts/includes/follow_button.html", context, request=request
+    )
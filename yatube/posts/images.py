@@ -0,0 +1,318 @@
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.images import get_image_dimensions
+from django.db import connections, transaction
+from PIL import Image
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+
+from .cache import acquire_lock, mark_page_incomplete, release_lock
+from .models import PostImage
+from .storage import file_digest, is_hashed
+
+logger = logging.getLogger(__name__)
+
+# Картинка карточки и страницы поста: пропорции 960x339, набор ширин
+# для srcset, а браузер сам выбирает подходящую по sizes.
+CARD_SIZE = (960, 339)
+CARD_WIDTHS = (320, 640, 960)
+CARD_OPTIONS = {"crop": "center", "upscale": True}
+CARD_SIZES = "(min-width: 768px) 66vw, 100vw"
+MIME_TYPES = {"AVIF": "image/avif", "WEBP": "image/webp"}
+lock_timeout: int = 60
+thumbnail_timeout: int = 60 * 60 * 24 * 30
+wait_step: float = 0.05
+
+_executor = None
+
+
+def format_supported(image_format):
+    """Формат умеют писать и Pillow, и sorl."""
+    Image.init()
+    return image_format in EXTENSIONS and image_format in Image.SAVE
+
+
+MODERN_FORMATS = tuple(
+    image_format for image_format in ("AVIF", "WEBP")
+    if format_supported(image_format)
+)
+
+
+def card_widths(image_width=None):
+    """Ширины вариантов без увеличения картинки больше оригинала.
+
+    Ширина оригинала хранится в посте, файл для этого не открывается.
+    """
+    if not image_width:
+        return CARD_WIDTHS
+    return tuple(
+        card_width for card_width in CARD_WIDTHS if card_width <= image_width
+    ) or CARD_WIDTHS[:1]
+
+
+def card_geometries(image_format, widths=CARD_WIDTHS):
+    width, height = CARD_SIZE
+    return [
+        (
+            f"{card_width}x{round(card_width * height / width)}",
+            dict(CARD_OPTIONS, format=image_format),
+        )
+        for card_width in widths
+    ]
+
+
+# Все геометрии, которые создаются заранее.
+THUMBNAIL_GEOMETRIES = tuple(
+    geometry
+    for image_format in ("JPEG", *MODERN_FORMATS)
+    for geometry in card_geometries(image_format)
+)
+
+
+def store_image_metadata(post):
+    """Заполняет размеры, объём и хэш новой картинки перед сохранением.
+
+    Файл читается один раз при загрузке, дальше геометрия и поиск
+    дубликатов обходятся без обращения к хранилищу.
+    """
+    if not post.image:
+        post.image_width = post.image_height = post.image_size = None
+        post.image_hash = ""
+        return
+    if post.image._committed:
+        return
+    upload = post.image.file
+    post.image_width, post.image_height = get_image_dimensions(upload)
+    post.image_size, post.image_hash = file_digest(upload)
+
+
+class LockingThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не создаёт одну миниатюру дважды.
+
+    Блокировка берётся только при промахе: первый запрос создаёт файл,
+    остальные ждут его появления в хранилище.
+    """
+
+    def _create_thumbnail(self, source_image, geometry_string, options,
+                          thumbnail):
+        name = f"thumbnail:{thumbnail.name}"
+        deadline = time.monotonic() + lock_timeout
+        while not acquire_lock(name, lock_timeout):
+            if time.monotonic() > deadline:
+                break
+            time.sleep(wait_step)
+        else:
+            try:
+                if not thumbnail.exists():
+                    return super()._create_thumbnail(
+                        source_image, geometry_string, options, thumbnail
+                    )
+            finally:
+                release_lock(name)
+        if thumbnail.exists():
+            image = default.engine.get_image(thumbnail)
+            thumbnail.set_size(default.engine.get_image_size(image))
+            return None
+        return super()._create_thumbnail(
+            source_image, geometry_string, options, thumbnail
+        )
+
+
+def thumbnail_key(image_name, widths=CARD_WIDTHS, image_hash=""):
+    """Ключ метаданных картинки.
+
+    Одинаковые по содержимому картинки делят один ключ по хэшу, и
+    миниатюры для них создаются один раз.
+    """
+    raw = f"{image_hash or image_name}|{widths}|{THUMBNAIL_GEOMETRIES}"
+    return f"thumbnail:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def forget_thumbnails(image_name):
+    """Удаляет метаданные вариантов картинки для всех наборов ширин."""
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    image_hash = stem if is_hashed(image_name) else ""
+    cache.delete_many([
+        thumbnail_key(image_name, CARD_WIDTHS[:count], image_hash)
+        for count in range(1, len(CARD_WIDTHS) + 1)
+    ])
+
+
+def resolve_thumbnail(image_name, geometry, options):
+    """Миниатюра через sorl: url и размеры для шаблона.
+
+    Варианты обрезаются по центру с увеличением (CARD_OPTIONS), так что
+    их размер равен геометрии и у sorl не спрашивается. Размера нет
+    только у миниатюры, которую sorl не смог создать.
+    """
+    thumbnail = get_thumbnail(image_name, geometry, **options)
+    if thumbnail.size is None:
+        return {"url": thumbnail.url, "width": None, "height": None}
+    width, height = map(int, geometry.split("x"))
+    return {"url": thumbnail.url, "width": width, "height": height}
+
+
+def build_srcset(thumbnails):
+    return ", ".join(
+        f"{thumbnail['url']} {thumbnail['width']}w"
+        for thumbnail in thumbnails if thumbnail["width"]
+    )
+
+
+def resolve_picture(image_name, widths=CARD_WIDTHS):
+    """Все варианты картинки карточки: JPEG и современные форматы."""
+    variants = {
+        image_format: [
+            resolve_thumbnail(image_name, geometry, options)
+            for geometry, options in card_geometries(image_format, widths)
+        ]
+        for image_format in ("JPEG", *MODERN_FORMATS)
+    }
+    return {
+        **variants["JPEG"][-1],
+        "srcset": build_srcset(variants["JPEG"]),
+        "sizes": CARD_SIZES,
+        "sources": [
+            {
+                "type": MIME_TYPES[image_format],
+                "srcset": build_srcset(variants[image_format]),
+            }
+            for image_format in MODERN_FORMATS
+        ],
+    }
+
+
+def attach_thumbnails(posts):
+    """Кладёт в post.thumbnail варианты картинки поста с размерами.
+
+    Метаданные всех постов читаются одним cache.get_many вместо
+    отдельного обращения sorl к хранилищу ключей на каждый тег. На
+    промахе варианты в запросе не создаются: отдаётся оригинал, а
+    варианты заказываются фоновому потоку (см. original_picture).
+    """
+    keys = {}
+    for post in posts:
+        post.thumbnail = None
+        if post.image:
+            widths = card_widths(post.image_width)
+            key = thumbnail_key(post.image.name, widths, post.image_hash)
+            keys.setdefault(key, (widths, []))[1].append(post)
+    found = cache.get_many(keys)
+    for key, (widths, key_posts) in keys.items():
+        picture = found.get(key)
+        if picture is None:
+            picture = request_thumbnails(key, key_posts[0])
+        for post in key_posts:
+            post.thumbnail = picture
+    return posts
+
+
+def original_picture(item):
+    """Оригинал картинки, пока варианты не готовы.
+
+    Размеры берутся из сохранённых при загрузке, файл не открывается.
+    Страница с такой картинкой кэшируется ненадолго (pending).
+    """
+    mark_page_incomplete()
+    return {
+        "url": item.image.url,
+        "width": item.image_width,
+        "height": item.image_height,
+        "srcset": "",
+        "sizes": "",
+        "sources": [],
+        "pending": True,
+    }
+
+
+def request_thumbnails(key, item):
+    """Заказывает варианты картинки один раз на lock_timeout секунд.
+
+    Без фоновых потоков (THUMBNAIL_WORKERS = 0) варианты создаются
+    сразу, и возвращаются уже они.
+    """
+    if acquire_lock(f"pregenerate:{key}", lock_timeout):
+        _submit((item.image.name, item.image_width, item.image_hash))
+        if not settings.THUMBNAIL_WORKERS:
+            picture = cache.get(key)
+            if picture is not None:
+                return picture
+    return original_picture(item)
+
+
+def attach_gallery(posts):
+    """Кладёт в post.gallery_images картинки галерей всех постов.
+
+    Галереи страницы читаются одним запросом и только для постов с
+    ненулевым gallery_count, без галерей запроса нет. Возвращается общий
+    список картинок, чтобы передать его в attach_thumbnails вместе
+    с постами.
+    """
+    galleries = {post.id: [] for post in posts if post.gallery_count}
+    images = list(
+        PostImage.objects.filter(post_id__in=galleries).order_by(
+            "post_id", "position", "id"
+        )
+    ) if galleries else []
+    for image in images:
+        galleries[image.post_id].append(image)
+    for post in posts:
+        post.gallery_images = galleries.get(post.id, [])
+    return images
+
+
+def pregenerate_thumbnails(image_name, image_width=None, image_hash="",
+                           force=False):
+    """Создаёт все варианты картинки и запоминает их метаданные.
+
+    С force варианты создаются заново, даже если метаданные есть:
+    sorl забывает прежние миниатюры и удаляет их файлы.
+    """
+    key = thumbnail_key(image_name, card_widths(image_width), image_hash)
+    if force:
+        delete(image_name, delete_file=False)
+    elif cache.get(key) is not None:
+        return
+    picture = resolve_picture(image_name, card_widths(image_width))
+    if picture["width"] is not None:
+        cache.set(key, picture, thumbnail_timeout)
+
+
+def _run_in_worker(image_name, image_width, image_hash):
+    try:
+        pregenerate_thumbnails(image_name, image_width, image_hash)
+    except Exception:
+        logger.exception("Не удалось создать миниатюры %s", image_name)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix="thumbnails",
+        )
+    return _executor
+
+
+def schedule_thumbnails(item):
+    """После коммита отдаёт картинку поста или галереи фоновому потоку."""
+    if not item.image:
+        return
+    args = (item.image.name, item.image_width, item.image_hash)
+    transaction.on_commit(lambda: _submit(args))
+
+
+def _submit(args):
+    if settings.THUMBNAIL_WORKERS:
+        get_executor().submit(_run_in_worker, *args)
+    else:
+        pregenerate_thumbnails(*args)
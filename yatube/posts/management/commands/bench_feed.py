@@ -0,0 +1,93 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from posts.counters import reconcile_user
+from posts.feeds import FeedPaginator, get_fanout_threshold
+from posts.models import FeedEntry, Follow, Post, User, UserStats
+
+per_page: int = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает усиление записи (fan-out) и задержку чтения ленты "
+        "подписок при разных порогах FEED_FANOUT_THRESHOLD. "
+        "Данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=500)
+        parser.add_argument("--authors", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=20,
+                            help="Постов на одного автора.")
+        parser.add_argument("--reads", type=int, default=100,
+                            help="Сколько лент прочитать для замера.")
+        parser.add_argument("--thresholds", type=int, nargs="+",
+                            default=[0, 50, 1000000])
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            "threshold  entries/post  write ms/post  read ms avg  read ms p95"
+        )
+        for threshold in options["thresholds"]:
+            with override_settings(FEED_FANOUT_THRESHOLD=threshold):
+                with transaction.atomic():
+                    row = self.run_case(options)
+                    transaction.set_rollback(True)
+            self.stdout.write(
+                "{:>9}  {:>12.1f}  {:>13.2f}  {:>11.2f}  {:>11.2f}".format(
+                    threshold, *row
+                )
+            )
+
+    def run_case(self, options):
+        User.objects.bulk_create(
+            User(username=f"bench_reader_{i}")
+            for i in range(options["readers"])
+        )
+        readers = list(
+            User.objects.filter(username__startswith="bench_reader_")
+        )
+        authors = [
+            User.objects.create(username=f"bench_author_{i}")
+            for i in range(options["authors"])
+        ]
+        # Распределение подписчиков близко к закону Ципфа:
+        # у первого автора подписаны все, у i-го - каждый i-й.
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author)
+            for i, author in enumerate(authors)
+            for reader in readers[:max(1, len(readers) // (i + 1))]
+        )
+        # bulk_create обходит сигналы: счётчики и режим ленты авторов
+        # выставляются здесь, как их выставили бы подписки по одной.
+        for author in authors:
+            reconcile_user(author.pk)
+        UserStats.objects.filter(
+            user__in=authors, followers_count__gt=get_fanout_threshold()
+        ).update(feed_pulled=True)
+        posts_total = options["posts"] * len(authors)
+        start = time.perf_counter()
+        for _ in range(options["posts"]):
+            for author in authors:
+                Post.objects.create(author=author, text="bench")
+        write_ms = (time.perf_counter() - start) * 1000 / posts_total
+        amplification = FeedEntry.objects.count() / posts_total
+
+        timings = []
+        for reader in readers[:options["reads"]]:
+            start = time.perf_counter()
+            len(FeedPaginator(reader, per_page).get_page(None))
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1] if timings else 0
+        return (
+            amplification,
+            write_ms,
+            statistics.mean(timings) if timings else 0,
+            p95,
+        )
@@ -0,0 +1,100 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from faker import Faker
+
+from posts.models import Post, User
+from posts.search import SearchPaginator, fts_table, normalize
+
+per_page: int = 10
+batch_size: int = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает поиск по индексу FTS5 с LIKE '%слово%' на большом "
+        "числе постов. Данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1000000)
+        parser.add_argument("--words", type=int, default=30,
+                            help="Слов в одном посте.")
+        parser.add_argument("--queries", nargs="+",
+                            help="Что искать; по умолчанию слова из словаря.")
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        fake = Faker("ru_RU")
+        vocabulary = sorted(
+            word for word in set(fake.words(2000)) if len(word) > 4
+        )
+        queries = options["queries"] or [
+            vocabulary[0],
+            f"{vocabulary[1]} {vocabulary[2]}",
+            "несуществующее",
+        ]
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.fill(options["posts"], options["words"], vocabulary)
+            self.stdout.write(
+                f"{options['posts']} постов за "
+                f"{time.perf_counter() - started:.1f} с"
+            )
+            self.stdout.write(
+                "query                 found  fts ms  like ms  like count ms"
+            )
+            for query in queries:
+                self.stdout.write(
+                    "{:<20}  {:>5}  {:>6.1f}  {:>7.1f}  {:>13.1f}".format(
+                        query[:20], *self.run_case(query, options["repeat"])
+                    )
+                )
+            transaction.set_rollback(True)
+
+    def fill(self, total, words, vocabulary):
+        """Посты пишутся пачками, индекс заполняется одним INSERT."""
+        author = User.objects.create(username="bench_searcher")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM posts_post")
+            last_id, = cursor.fetchone()
+        for start in range(0, total, batch_size):
+            Post.objects.bulk_create(
+                Post(
+                    author=author,
+                    text=" ".join(random.choices(vocabulary, k=words)),
+                )
+                for _ in range(min(batch_size, total - start))
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {fts_table} (rowid, text) "
+                f"SELECT id, text FROM posts_post WHERE id > %s",
+                [last_id],
+            )
+
+    def run_case(self, query, repeat):
+        fts, like, count = [], [], []
+        found = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            found = len(SearchPaginator(query, per_page).get_page(None))
+            fts.append(time.perf_counter() - started)
+            posts = Post.objects.for_cards().filter(
+                text__icontains=normalize(query)
+            )
+            started = time.perf_counter()
+            list(posts.order_by("-pub_date", "-id")[:per_page])
+            like.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            posts.count()
+            count.append(time.perf_counter() - started)
+        return (
+            found,
+            statistics.median(fts) * 1000,
+            statistics.median(like) * 1000,
+            statistics.median(count) * 1000,
+        )
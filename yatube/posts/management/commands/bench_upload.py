@@ -0,0 +1,162 @@
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, ClientHandler
+from django.test.utils import override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts.models import Post, User
+
+
+def noise_jpeg(side):
+    """JPEG из шума: почти не сжимается, объём растёт с площадью."""
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def bomb_png(side):
+    """Однотонный PNG: файл крошечный, а пикселей side * side."""
+    buffer = BytesIO()
+    Image.new("1", (side, side)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def write_body(file, content, content_type):
+    """multipart-тело запроса post_create с картинкой."""
+    extension = content_type.split("/")[1]
+    file.write(
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="text"\r\n\r\n'
+        f"Загрузка\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="image"; '
+        f'filename="bench.{extension}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n".encode()
+    )
+    file.write(content)
+    file.write(f"\r\n--{BOUNDARY}--\r\n".encode())
+
+
+def peak_rss():
+    """Пик RSS процесса в КБ.
+
+    VmHWM у нового процесса свой, а ru_maxrss после exec наследует пик
+    родителя, поэтому он только запасной вариант не для Linux.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    help = (
+        "Пиковая память (RSS) на одну загрузку картинки через post_create. "
+        "Каждая загрузка идёт в свежем процессе, тело запроса читается "
+        "из файла, пост создаётся в транзакции и откатывается."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sides", type=int, nargs="+", default=[500, 1500, 3000, 4500],
+            help="Стороны шумовых JPEG в пикселях.",
+        )
+        parser.add_argument(
+            "--bomb-side", type=int, default=20000,
+            help="Сторона однотонного PNG для проверки защиты от бомб.",
+        )
+        parser.add_argument("--body", help="Служебный: одна загрузка.")
+
+    def handle(self, *args, **options):
+        if options["body"]:
+            self.stdout.write(" ".join(map(str, self.upload(options["body"]))))
+            return
+        cases = [
+            (f"jpeg {side}x{side}", noise_jpeg(side), "image/jpeg")
+            for side in options["sides"]
+        ]
+        side = options["bomb_side"]
+        cases.append((f"png {side}x{side}", bomb_png(side), "image/png"))
+        self.stdout.write(
+            "case                 file MB  result    ms  peak MB  +RSS MB"
+        )
+        for name, content, content_type in cases:
+            with tempfile.NamedTemporaryFile() as body:
+                write_body(body, content, content_type)
+                body.flush()
+                output = subprocess.run(
+                    [
+                        sys.executable,
+                        os.path.join(settings.BASE_DIR, "manage.py"),
+                        "bench_upload", "--body", body.name,
+                    ],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+            result, elapsed, before, peak = output.split()
+            self.stdout.write(
+                "{:<19}  {:>7.2f}  {:<8}  {:>4.0f}  {:>7.1f}  {:>7.1f}".format(
+                    name, len(content) / 2 ** 20, result,
+                    float(elapsed) * 1000, int(peak) / 1024,
+                    (int(peak) - int(before)) / 1024,
+                )
+            )
+
+    @staticmethod
+    def upload(path):
+        """Отправляет тело из файла прямо в обработчик Django.
+
+        Файл не читается в память целиком, поэтому прирост пика RSS
+        показывает только то, что тратит сам сервер на загрузку.
+        """
+        size = os.path.getsize(path)
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root), \
+                transaction.atomic(), open(path, "rb") as body:
+            author = User.objects.create(username="bench_uploader")
+            client = Client()
+            client.force_login(author)
+            environ = {
+                "REQUEST_METHOD": "POST",
+                "PATH_INFO": reverse("posts:post_create"),
+                "SCRIPT_NAME": "",
+                "QUERY_STRING": "",
+                "SERVER_NAME": "testserver",
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "REMOTE_ADDR": "127.0.0.1",
+                "CONTENT_TYPE": MULTIPART_CONTENT,
+                "CONTENT_LENGTH": str(size),
+                "HTTP_COOKIE": client.cookies.output(
+                    header="", sep=";"
+                ).strip(),
+                "wsgi.input": body,
+                "wsgi.url_scheme": "http",
+                "wsgi.errors": sys.stderr,
+            }
+            before = peak_rss()
+            started = time.perf_counter()
+            response = ClientHandler(enforce_csrf_checks=False)(environ)
+            elapsed = time.perf_counter() - started
+            created = Post.objects.filter(author=author).exists()
+            transaction.set_rollback(True)
+        if response.status_code not in (200, 302):
+            result = f"http{response.status_code}"
+        else:
+            result = "accepted" if created else "rejected"
+        return result, elapsed, before, peak_rss()
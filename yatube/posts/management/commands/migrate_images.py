@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import bump_generations
+from posts.models import Post
+from posts.storage import file_digest, hashed_name, is_hashed
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит картинки постов в хранилище по хэшу содержимого: "
+        "файлы читаются по одному кусками, одинаковые склеиваются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=500,
+            help="Сколько строк читать из базы за раз.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Только посчитать, ничего не переносить.",
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field("image").storage
+        names = Post.objects.exclude(image="").order_by().values_list(
+            "image", flat=True
+        ).distinct()
+        moved = merged = missing = 0
+        for name in names.iterator(chunk_size=options["chunk_size"]):
+            if is_hashed(name):
+                continue
+            try:
+                with storage.open(name) as source:
+                    size, content_hash = file_digest(source)
+                    new_name = hashed_name(name, content_hash)
+                    merged += storage.exists(new_name)
+                    if not options["dry_run"]:
+                        storage.store(name, source, content_hash)
+            except FileNotFoundError:
+                missing += 1
+                self.stderr.write(f"Нет файла {name}")
+                continue
+            moved += 1
+            if options["dry_run"]:
+                continue
+            Post.objects.filter(image=name).update(
+                image=new_name, image_size=size, image_hash=content_hash
+            )
+            # Миниатюры старого файла не трогаем: на них ссылаются
+            # закэшированные страницы, пока не истечёт их срок.
+            storage.delete(name)
+        if moved and not options["dry_run"]:
+            bump_generations("articles")
+        self.stdout.write(
+            f"Перенесено: {moved}, совпало с уже сохранёнными: {merged}, "
+            f"нет файла: {missing}"
+        )
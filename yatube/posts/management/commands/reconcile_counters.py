@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_all
+from posts.feeds import sync_feed_modes
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает денормализованные счётчики постов, комментариев "
+        "и подписок и исправляет расхождения. Затем сверяет режим лент "
+        "авторов с текущим FEED_FANOUT_THRESHOLD."
+    )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_all()
+        self.stdout.write(
+            "Исправлено: пользователей {users}, постов {posts}, "
+            "групп {groups}".format(**fixed)
+        )
+        pulled, pushed = sync_feed_modes()
+        self.stdout.write(
+            f"Лент: на чтение по запросу {pulled}, на раскладку {pushed}"
+        )
@@ -0,0 +1,156 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.images import pregenerate_thumbnails
+from posts.models import Post, PostImage
+
+
+def generate(row, force=False):
+    """Создаёт миниатюры одной картинки в процессе пула."""
+    image_name, image_width, image_hash = row
+    try:
+        pregenerate_thumbnails(image_name, image_width, image_hash, force)
+    except Exception as error:
+        return f"{image_name}: {error}"
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Заново создаёт миниатюры всех картинок постов и галерей в пуле "
+        "процессов, например после смены геометрии. Уже готовые "
+        "пропускаются, если не указан --force, прерванный запуск "
+        "продолжается с контрольной точки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(),
+            help="Число процессов; 0 - в текущем процессе.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=200,
+            help="Сколько картинок читать и отдавать пулу за раз.",
+        )
+        parser.add_argument(
+            "--rate", type=float, default=0,
+            help="Не больше стольких картинок в секунду; 0 - без ограничения.",
+        )
+        parser.add_argument(
+            "--start-after", type=int, default=0,
+            help="Пропустить посты с id не больше этого.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Файл, где хранится id последнего обработанного поста; "
+                 "для галерей рядом ведётся <файл>.gallery.",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Создать миниатюры заново, даже если они есть в кэше, "
+                 "например после очистки файлов или смены хранилища.",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options["checkpoint"]
+        sources = (
+            (
+                "пост",
+                Post.objects.exclude(image=""),
+                checkpoint,
+                max(options["start_after"], self.read_checkpoint(checkpoint)),
+            ),
+            (
+                "картинка галереи",
+                PostImage.objects.exclude(image=""),
+                checkpoint and f"{checkpoint}.gallery",
+                self.read_checkpoint(checkpoint and f"{checkpoint}.gallery"),
+            ),
+        )
+        pool = None
+        if options["workers"]:
+            # Процессы запускаются до открытия курсора, чтобы не
+            # унаследовать соединение с базой родителя.
+            connections.close_all()
+            pool = ProcessPoolExecutor(
+                max_workers=options["workers"], initializer=django.setup
+            )
+            pool.submit(int).result()
+        self.task = partial(generate, force=options["force"])
+        self.done = self.failed = 0
+        self.started = time.monotonic()
+        try:
+            for label, queryset, path, start_after in sources:
+                rows = queryset.order_by("pk").values_list(
+                    "pk", "image", "image_width", "image_hash"
+                )
+                self.process(rows, start_after, path, label, pool, options)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f"Итого {self.done} картинок за {elapsed:.1f} с, "
+            f"{self.done / elapsed if elapsed else 0:.1f} картинок/с, "
+            f"ошибок {self.failed}"
+        )
+
+    def process(self, rows, start_after, checkpoint, label, pool, options):
+        """Создаёт миниатюры строк rows кусками, с контрольной точкой."""
+        for chunk in self.chunks(rows, start_after, options["chunk_size"]):
+            # Одинаковые файлы хранятся один раз: без повторов.
+            images = list(dict.fromkeys(row[1:] for row in chunk))
+            if pool is None:
+                errors = map(self.task, images)
+            else:
+                errors = pool.map(self.task, images)
+            for error in errors:
+                if error:
+                    self.failed += 1
+                    self.stderr.write(error)
+            self.done += len(images)
+            self.write_checkpoint(checkpoint, chunk[-1][0])
+            elapsed = time.monotonic() - self.started
+            if options["rate"]:
+                ahead = self.done / options["rate"] - elapsed
+                if ahead > 0:
+                    time.sleep(ahead)
+                    elapsed += ahead
+            self.stdout.write(
+                f"Готово {self.done}, ошибок {self.failed}, "
+                f"{self.done / elapsed:.1f} картинок/с, "
+                f"последний {label} {chunk[-1][0]}"
+            )
+
+    @staticmethod
+    def chunks(rows, start_after, size):
+        """Куски по ключу id: курсор не остаётся открытым, пока пул
+        пишет в базу, и SQLite не блокирует запись воркеров.
+        """
+        while True:
+            chunk = list(rows.filter(pk__gt=start_after)[:size])
+            if not chunk:
+                return
+            yield chunk
+            start_after = chunk[-1][0]
+
+    @staticmethod
+    def read_checkpoint(path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+
+    @staticmethod
+    def write_checkpoint(path, pk):
+        if not path:
+            return
+        with open(f"{path}.tmp", "w") as checkpoint:
+            checkpoint.write(str(pk))
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.warmup import (
+    hottest_paths, warm_concurrency, warm_groups, warm_pages, warm_profiles
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогревает кэш после выкладки или сброса: рендерит главную, "
+        "самые большие группы и самые читаемые профили вместе с "
+        "карточками постов и миниатюрами и печатает время каждой страницы."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--groups", type=int, default=warm_groups)
+        parser.add_argument("--profiles", type=int, default=warm_profiles)
+        parser.add_argument(
+            "--concurrency", type=int, default=warm_concurrency,
+            help="Сколько страниц рендерить одновременно; 0 - по очереди.",
+        )
+        parser.add_argument(
+            "--host", default=settings.WARM_CACHE_HOST,
+            help="Хост, под которым страницы запрашивают пользователи.",
+        )
+        parser.add_argument(
+            "--https", action="store_true",
+            default=settings.WARM_CACHE_SECURE,
+        )
+
+    def handle(self, *args, **options):
+        paths = hottest_paths(options["groups"], options["profiles"])
+        started = time.perf_counter()
+        failed = 0
+        self.stdout.write("status       ms  path")
+        for path, status, elapsed in warm_pages(
+            paths, options["host"], options["https"], options["concurrency"]
+        ):
+            failed += status != 200
+            self.stdout.write(
+                f"{status or 'error':>6}  {elapsed * 1000:>7.1f}  {path}"
+            )
+        self.stdout.write(
+            f"Прогрето {len(paths) - failed} из {len(paths)} страниц "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
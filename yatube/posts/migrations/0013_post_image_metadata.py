@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:38
+
+import hashlib
+
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def fill_image_metadata(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    rows = Post.objects.exclude(image='').values_list('pk', 'image')
+    for pk, name in rows.iterator():
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with default_storage.open(name) as image:
+                for chunk in image.chunks():
+                    digest.update(chunk)
+                    size += len(chunk)
+                width, height = get_image_dimensions(image)
+        except OSError:
+            continue
+        Post.objects.filter(pk=pk).update(
+            image_width=width,
+            image_height=height,
+            image_size=size,
+            image_hash=digest.hexdigest(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='SHA-256 картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Размер картинки в байтах'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(fill_image_metadata, migrations.RunPython.noop),
+    ]
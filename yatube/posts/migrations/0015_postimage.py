@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='gallery_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Число картинок в галерее'),
+        ),
+        migrations.CreateModel(
+            name='PostImage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(db_index=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка')),
+                ('image_width', models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки')),
+                ('image_height', models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки')),
+                ('image_size', models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Размер картинки в байтах')),
+                ('image_hash', models.CharField(blank=True, editable=False, max_length=64, verbose_name='SHA-256 картинки')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gallery', to='posts.Post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Картинка галереи',
+                'verbose_name_plural': 'Галерея',
+                'ordering': ('position', 'id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='postimage',
+            index=models.Index(fields=['post', 'position', 'id'], name='post_image_position'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# Копия текста поста в FTS5: rowid совпадает с id поста. Ё заменяется
+# на е так же, как в posts.search.normalize.
+CREATE_INDEX = """
+CREATE VIRTUAL TABLE posts_post_fts USING fts5(
+    text, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+FILL_INDEX = """
+INSERT INTO posts_post_fts (rowid, text)
+SELECT id, replace(replace(text, 'ё', 'е'), 'Ё', 'Е') FROM posts_post
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_postimage'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [CREATE_INDEX, FILL_INDEX],
+            reverse_sql="DROP TABLE posts_post_fts",
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feed_pulled(apps, schema_editor):
+    """Режим авторов, которые уже больше порога."""
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_THRESHOLD
+    ).update(feed_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='feed_pulled',
+            field=models.BooleanField(default=False, help_text='Автор больше порога FEED_FANOUT_THRESHOLD: его посты не раскладываются по лентам подписчиков.', verbose_name='Посты читаются при запросе ленты'),
+        ),
+        migrations.RunPython(fill_feed_pulled, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,36 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 set_limit = 15
 
 
+def card_fields(prefix=""):
+    """Поля, нужные карточке includes/article.html, кроме текста."""
+    return [
+        f"{prefix}{field}" for field in (
+            "id", "pub_date", "updated",
+            "image", "image_width", "image_height", "image_hash",
+            "gallery_count",
+            "author__id", "author__username",
+            "author__first_name", "author__last_name",
+            "group__id", "group__slug", "group__title",
+        )
+    ]
+
+
+class PostQuerySet(models.QuerySet):
+    def for_cards(self):
+        """Посты для карточек ленты одним запросом с автором и группой.
+
+        Длинный text отложен: он читается только для карточек, которых
+        нет в кэше, одним запросом на страницу (см. attach_articles).
+        """
+        return self.select_related("author", "group").only(*card_fields())
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name="Текст поста",
@@ -14,6 +40,10 @@ class Post(models.Model):
         verbose_name="Дата публикации",
         auto_now_add=True,
     )
+    updated = models.DateTimeField(
+        verbose_name="Дата изменения",
+        auto_now=True,
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -32,22 +62,133 @@ class Post(models.Model):
     image = models.ImageField(
         "Картинка",
         upload_to="posts/",
-        blank=True
+        storage=ContentAddressedStorage(),
+        blank=True,
+        db_index=True
+    )
+    image_width = models.PositiveIntegerField(
+        "Ширина картинки",
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        "Высота картинки",
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        "Размер картинки в байтах",
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_hash = models.CharField(
+        "SHA-256 картинки",
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        "Число комментариев",
+        default=0,
+        editable=False
+    )
+    gallery_count = models.PositiveSmallIntegerField(
+        "Число картинок в галерее",
+        default=0,
+        editable=False
     )
 
+    objects = PostQuerySet.as_manager()
+
     def __str__(self):
         return self.text[:set_limit]
 
     class Meta:
         ordering = ("-pub_date",)
+        indexes = [
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="post_author_pub_date",
+            ),
+            models.Index(
+                fields=["group", "-pub_date", "-id"],
+                name="post_group_pub_date",
+            ),
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="post_pub_date",
+            ),
+        ]
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
 
 
+class PostImage(models.Model):
+    """Картинка галереи поста, порядок задаёт position."""
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="gallery",
+        verbose_name="Пост",
+    )
+    image = models.ImageField(
+        "Картинка",
+        upload_to="posts/",
+        storage=ContentAddressedStorage(),
+        db_index=True
+    )
+    image_width = models.PositiveIntegerField(
+        "Ширина картинки",
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        "Высота картинки",
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        "Размер картинки в байтах",
+        blank=True,
+        null=True,
+        editable=False
+    )
+    image_hash = models.CharField(
+        "SHA-256 картинки",
+        max_length=64,
+        blank=True,
+        editable=False
+    )
+    position = models.PositiveSmallIntegerField("Порядок", default=0)
+
+    class Meta:
+        ordering = ("position", "id")
+        indexes = [
+            models.Index(
+                fields=["post", "position", "id"],
+                name="post_image_position",
+            ),
+        ]
+        verbose_name = "Картинка галереи"
+        verbose_name_plural = "Галерея"
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        "Число постов",
+        default=0,
+        editable=False
+    )
 
     def __str__(self):
         return self.title
@@ -82,6 +223,12 @@ class Comment(models.Model):
         return self.text[:set_limit]
 
     class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "created", "id"],
+                name="comment_post_created",
+            ),
+        ]
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
 
@@ -110,5 +257,87 @@ class Follow(models.Model):
                 name="user_author",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["author", "user"],
+                name="follow_author_user",
+            ),
+        ]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name="feed",
+        on_delete=models.CASCADE,
+        verbose_name="Читатель"
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name="feed_entries",
+        on_delete=models.CASCADE,
+        verbose_name="Пост"
+    )
+    author = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.CASCADE,
+        verbose_name="Автор поста"
+    )
+    pub_date = models.DateTimeField(
+        verbose_name="Дата публикации"
+    )
+
+    def __str__(self):
+        return f"{self.post_id} в ленте {self.user_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                name="feed_user_post",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="feed_user_pub_date",
+            ),
+            models.Index(
+                fields=["user", "author"],
+                name="feed_user_author",
+            ),
+        ]
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        related_name="stats",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name="Пользователь"
+    )
+    posts_count = models.PositiveIntegerField("Число постов", default=0)
+    followers_count = models.PositiveIntegerField(
+        "Число подписчиков",
+        default=0
+    )
+    following_count = models.PositiveIntegerField("Число подписок", default=0)
+    feed_pulled = models.BooleanField(
+        "Посты читаются при запросе ленты",
+        default=False,
+        help_text="Автор больше порога FEED_FANOUT_THRESHOLD: "
+                  "его посты не раскладываются по лентам подписчиков.",
+    )
+
+    def __str__(self):
+        return f"Счётчики {self.user_id}"
+
+    class Meta:
+        verbose_name = "Счётчики пользователя"
+        verbose_name_plural = "Счётчики пользователей"
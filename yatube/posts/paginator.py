@@ -0,0 +1,175 @@
+import base64
+import json
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+FORWARD = "n"
+BACKWARD = "p"
+# До стольких строк точный COUNT(*) дешевле, чем ошибка оценки.
+exact_count_limit: int = 10000
+
+
+def pack_token(payload):
+    """Кодирует JSON-совместимое значение в непрозрачный токен."""
+    payload = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def unpack_token(token):
+    """Обратное к pack_token; на битом токене ValueError."""
+    padded = token + "=" * (-len(token) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+
+
+def encode_cursor(pub_date, pk, direction):
+    """Упаковывает позицию (pub_date, id) в непрозрачный токен."""
+    return pack_token([pub_date.isoformat(), pk, direction])
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id, direction) или None для битого токена."""
+    try:
+        pub_date, pk, direction = unpack_token(token)
+        pub_date = parse_datetime(pub_date)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if pub_date is None or not isinstance(pk, int):
+        return None
+    if direction not in (FORWARD, BACKWARD):
+        return None
+    return pub_date, pk, direction
+
+
+def keyset_slice(queryset, position, direction, limit,
+                 date_field="pub_date", key_field="id", descending=True):
+    """Первые limit строк после позиции в заданном направлении."""
+    if (direction == FORWARD) == descending:
+        lookup, ordering = "lt", (f"-{date_field}", f"-{key_field}")
+    else:
+        lookup, ordering = "gt", (date_field, key_field)
+    if position is not None:
+        pub_date, pk = position
+        queryset = queryset.filter(
+            Q(**{f"{date_field}__{lookup}": pub_date})
+            | Q(**{date_field: pub_date, f"{key_field}__{lookup}": pk})
+        )
+    return list(queryset.order_by(*ordering)[:limit])
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (pub_date, id) вместо LIMIT/OFFSET.
+
+    Стоимость страницы не зависит от её глубины, COUNT(*) не выполняется.
+    Всего строк не знает никто, поэтому номер страницы, count и
+    num_pages считаются по окну вокруг выбранной страницы: предыдущая
+    (если есть), она сама и следующая (если есть). Так has_next() и
+    has_previous() страницы отвечают по лишней выбранной строке.
+    """
+
+    date_field = "pub_date"
+    key_field = "id"
+    descending = True
+    # (есть предыдущая, строк на странице, есть следующая)
+    _window = (False, 0, False)
+
+    def __init__(self, object_list, per_page):
+        sign = "-" if self.descending else ""
+        super().__init__(
+            object_list.order_by(
+                f"{sign}{self.date_field}", f"{sign}{self.key_field}"
+            ),
+            per_page,
+        )
+
+    def get_page(self, cursor):
+        """Возвращает страницу по токену; битый токен - первая страница."""
+        position = self.decode(cursor) if cursor else None
+        limit = self.per_page + 1
+        if position is None:
+            rows = self.fetch(None, FORWARD, limit)
+            return self._build_page(rows, has_previous=False)
+        pub_date, pk, direction = position
+        rows = self.fetch((pub_date, pk), direction, limit)
+        if direction == FORWARD:
+            return self._build_page(rows, has_previous=True)
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return self._build_page(rows, has_previous, has_next=True)
+
+    def decode(self, cursor):
+        """Позиция и направление из токена, None для битого токена."""
+        return decode_cursor(cursor)
+
+    def fetch(self, position, direction, limit):
+        """Строки после позиции, упорядоченные в сторону direction."""
+        return keyset_slice(
+            self.object_list, position, direction, limit,
+            self.date_field, self.key_field, self.descending,
+        )
+
+    def get_rows(self, rows):
+        """Превращает строки выборки в объекты страницы."""
+        return rows
+
+    @property
+    def count(self):
+        has_previous, size, has_next = self._window
+        return has_previous * self.per_page + size + has_next
+
+    @property
+    def num_pages(self):
+        has_previous, _, has_next = self._window
+        return 1 + has_previous + has_next
+
+    def _build_page(self, rows, has_previous, has_next=None):
+        if has_next is None:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        object_list = self.get_rows(rows)
+        has_previous = bool(rows) and has_previous
+        has_next = bool(rows) and has_next
+        self._window = (has_previous, len(object_list), has_next)
+        page = Page(object_list, 1 + has_previous, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if has_next:
+            page.next_cursor = self._cursor(rows[-1], FORWARD)
+        if has_previous:
+            page.previous_cursor = self._cursor(rows[0], BACKWARD)
+        return page
+
+    def _cursor(self, row, direction):
+        return encode_cursor(
+            getattr(row, self.date_field),
+            getattr(row, self.key_field),
+            direction,
+        )
+
+
+class CommentPaginator(CursorPaginator):
+    """Комментарии по порядку написания, ключ (created, id)."""
+
+    date_field = "created"
+    descending = False
+
+
+class EstimatedCountPaginator(Paginator):
+    """Для списков без фильтров число строк оценивается по MAX(id),
+    который SQLite берёт из конца первичного ключа, без COUNT(*).
+
+    Оценка не меньше настоящего числа: последние страницы после
+    удалений могут оказаться пустыми. Отфильтрованные и небольшие
+    списки считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        if self.object_list.query.where:
+            return super().count
+        estimate = self.object_list.aggregate(last=Max("pk"))["last"] or 0
+        if estimate <= exact_count_limit:
+            return super().count
+        return estimate
@@ -0,0 +1,162 @@
+import re
+
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginator import (
+    BACKWARD, FORWARD, CursorPaginator, pack_token, unpack_token
+)
+
+# Полнотекстовый индекс SQLite FTS5, rowid совпадает с id поста.
+fts_table: str = "posts_post_fts"
+snippet_words: int = 16
+# Короче этого основа не обрезается: иначе префикс находит всё подряд.
+min_stem: int = 3
+
+WORD_RE = re.compile(r"\w+")
+CYRILLIC_RE = re.compile(r"[а-я]")
+# Окончания русских слов, от длинных к коротким. Поиск идёт по
+# префиксу основы, так что "котами" находит и "кот", и "котиков".
+ENDINGS = sorted(
+    (
+        "иями", "ями", "ами", "иях", "ях", "ах", "ием", "ией", "ий", "ый",
+        "ой", "ей", "ем", "ом", "ам", "ям", "ов", "ев", "ого", "его",
+        "ому", "ему", "ыми", "ими", "ая", "яя", "ое", "ее", "ые", "ие",
+        "ую", "юю", "ия", "ию", "ость", "ости", "ать", "ять", "ить",
+        "еть", "ешь", "ете", "ите", "ет", "ит", "ут", "ют", "ат", "ят",
+        "ла", "ли", "ло", "ся", "сь", "а", "я", "о", "е", "ы", "и", "у",
+        "ю", "ь", "й",
+    ),
+    key=len,
+    reverse=True,
+)
+# Границы подсветки в snippet(): заведомо не встречаются в тексте
+# и переживают экранирование HTML.
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+
+def normalize(text):
+    """Текст для индекса: unicode61 не приравнивает ё к е."""
+    return text.replace("ё", "е").replace("Ё", "Е")
+
+
+def stem(word):
+    """Грубая основа русского слова: отрезает одно окончание."""
+    if not CYRILLIC_RE.search(word):
+        return word
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= min_stem:
+            return word[:-len(ending)]
+    return word
+
+
+def build_match(query):
+    """Запрос FTS5: все слова обязательны, каждое ищется по префиксу
+    основы. Пустая строка - искать нечего.
+    """
+    words = WORD_RE.findall(normalize(query).lower())
+    return " ".join(f'"{stem(word)}"*' for word in words)
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset только посты, найденные индексом."""
+    match = build_match(query)
+    if not match:
+        return queryset
+    # Не pk__in=RawSQL(...): Django оборачивает подзапрос во вторые
+    # скобки, и SQLite считает его скаляром, то есть первой строкой.
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        where=[
+            f'"{table}"."id" IN (SELECT rowid FROM {fts_table} '
+            f"WHERE {fts_table} MATCH %s)"
+        ],
+        params=[match],
+    )
+
+
+def index_post(post_id, text):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {fts_table} (rowid, text) "
+            f"VALUES (%s, %s)",
+            [post_id, normalize(text)],
+        )
+
+
+def unindex_post(post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {fts_table} WHERE rowid = %s", [post_id]
+        )
+
+
+def highlight(snippet):
+    """Экранирует фрагмент и размечает найденные слова тегом mark."""
+    html = escape(snippet).replace(MARK_START, "<mark>")
+    return mark_safe(html.replace(MARK_END, "</mark>"))
+
+
+class SearchPaginator(CursorPaginator):
+    """Результаты поиска по релевантности bm25, ключ (rank, id).
+
+    Страница читается из индекса с LIMIT, карточки постов догружаются
+    одним запросом по id.
+    """
+
+    def __init__(self, query, per_page):
+        Paginator.__init__(self, (), per_page)
+        self.match = build_match(query)
+
+    def decode(self, cursor):
+        try:
+            rank, pk, direction = unpack_token(cursor)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            return None
+        if not isinstance(rank, float) or not isinstance(pk, int):
+            return None
+        if direction not in (FORWARD, BACKWARD):
+            return None
+        return rank, pk, direction
+
+    def fetch(self, position, direction, limit):
+        if not self.match:
+            return []
+        if direction == FORWARD:
+            lookup, ordering = ">", "rank, rowid"
+        else:
+            lookup, ordering = "<", "rank DESC, rowid DESC"
+        where, params = "", [self.match]
+        if position is not None:
+            rank, pk = position
+            where = (
+                f"AND (rank {lookup} %s OR (rank = %s AND rowid {lookup} %s))"
+            )
+            params += [rank, rank, pk]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, rank, snippet({fts_table}, 0, "
+                f"'{MARK_START}', '{MARK_END}', '…', {snippet_words}) "
+                f"FROM {fts_table} WHERE {fts_table} MATCH %s {where} "
+                f"ORDER BY {ordering} LIMIT %s",
+                params + [limit],
+            )
+            return cursor.fetchall()
+
+    def get_rows(self, rows):
+        posts = Post.objects.for_cards().in_bulk([row[0] for row in rows])
+        found = []
+        for pk, rank, snippet in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.snippet = highlight(snippet)
+                found.append(post)
+        return found
+
+    def _cursor(self, row, direction):
+        pk, rank, _ = row
+        return pack_token([rank, pk, direction])
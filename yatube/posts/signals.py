@@ -0,0 +1,260 @@
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from core import bus
+
+from .articles import forget_article
+from .cache import bump_generations, now_and_on_commit
+from .counters import (
+    bump_group, bump_post_comments, bump_post_gallery, bump_user
+)
+from .feeds import backfill_feed, fan_out_post, prune_feed, start_pulling
+from .images import forget_thumbnails, store_image_metadata
+from .search import index_post, unindex_post
+from .storage import image_lock, is_claimed
+from .models import Comment, Follow, Group, Post, PostImage, User
+
+logger = logging.getLogger(__name__)
+
+
+def invalidate_post_pages(post, group_ids):
+    """Сбрасывает кэш ленты, профиля автора и групп поста."""
+    slugs = Group.objects.filter(
+        id__in=[group_id for group_id in group_ids if group_id]
+    ).values_list("slug", flat=True)
+    bump_generations(
+        "index",
+        f"profile:{post.author.username}",
+        *(f"group:{slug}" for slug in slugs),
+    )
+
+
+def release_image(name):
+    """После коммита удаляет картинку и её миниатюры, если файл больше
+    не нужен ни одному посту: одинаковые загрузки хранятся одним файлом.
+    """
+    if not name:
+        return
+
+    def delete_unreferenced():
+        with image_lock(name) as locked:
+            if not locked or is_referenced(name):
+                return
+            storage = Post._meta.get_field("image").storage
+            try:
+                delete(ImageFile(name, storage))
+            except (OSError, SuspiciousFileOperation):
+                logger.exception("Не удалось удалить картинку %s", name)
+            forget_thumbnails(name)
+
+    transaction.on_commit(delete_unreferenced)
+
+
+def is_referenced(name):
+    """На файл ссылается пост, картинка галереи или идущая загрузка."""
+    return (
+        is_claimed(name)
+        or Post.objects.filter(image=name).exists()
+        or PostImage.objects.filter(image=name).exists()
+    )
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    store_image_metadata(instance)
+    instance._previous_group_id = None
+    instance._previous_updated = None
+    instance._previous_image = ""
+    if instance.pk:
+        (
+            instance._previous_group_id,
+            instance._previous_updated,
+            instance._previous_image,
+        ) = Post.objects.filter(pk=instance.pk).values_list(
+            "group_id", "updated", "image"
+        ).first() or (None, None, "")
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, update_fields, **kwargs):
+    if update_fields is None or "text" in update_fields:
+        index_post(instance.id, instance.text)
+    if created:
+        bump_user(instance.author_id, posts_count=1)
+        bump_group(instance.group_id, 1)
+        fan_out_post(instance)
+    else:
+        previous_group_id = getattr(instance, "_previous_group_id", None)
+        if previous_group_id != instance.group_id:
+            bump_group(previous_group_id, -1)
+            bump_group(instance.group_id, 1)
+    previous_updated = getattr(instance, "_previous_updated", None)
+    if previous_updated is not None:
+        forget_article(instance.id, previous_updated)
+    previous_image = getattr(instance, "_previous_image", "")
+    if previous_image != instance.image.name:
+        release_image(previous_image)
+    invalidate_post_pages(
+        instance,
+        [instance.group_id, getattr(instance, "_previous_group_id", None)],
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_user(instance.author_id, posts_count=-1)
+    bump_group(instance.group_id, -1)
+    unindex_post(instance.id)
+    release_image(instance.image.name)
+    invalidate_post_pages(instance, [instance.group_id])
+    now_and_on_commit(bus.publish, tags=[f"post:{instance.id}"])
+
+
+def gallery_changed(instance, delta):
+    """Обновляет счётчик галереи и сбрасывает кэш страниц поста."""
+    bump_post_gallery(instance.post_id, delta)
+    post = Post.objects.select_related("author").filter(
+        pk=instance.post_id
+    ).first()
+    if post is not None:
+        invalidate_post_pages(post, [post.group_id])
+
+
+@receiver(pre_save, sender=PostImage)
+def gallery_image_saving(sender, instance, **kwargs):
+    store_image_metadata(instance)
+    instance._previous_image = ""
+    if instance.pk:
+        instance._previous_image = PostImage.objects.filter(
+            pk=instance.pk
+        ).values_list("image", flat=True).first() or ""
+
+
+@receiver(post_save, sender=PostImage)
+def gallery_image_saved(sender, instance, created, **kwargs):
+    gallery_changed(instance, 1 if created else 0)
+    previous_image = getattr(instance, "_previous_image", "")
+    if previous_image != instance.image.name:
+        release_image(previous_image)
+
+
+@receiver(post_delete, sender=PostImage)
+def gallery_image_deleted(sender, instance, **kwargs):
+    gallery_changed(instance, -1)
+    release_image(instance.image.name)
+
+
+@receiver(pre_save, sender=Group)
+def group_saving(sender, instance, **kwargs):
+    instance._previous_slug = None
+    if instance.pk:
+        instance._previous_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list("slug", flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    authors = User.objects.filter(
+        posts__group=instance
+    ).distinct().values_list("username", flat=True)
+    # После смены slug страница по старому адресу тоже устаревает.
+    previous_slug = getattr(instance, "_previous_slug", None)
+    bump_generations(
+        "index",
+        "articles",
+        f"group:{instance.slug}",
+        *([f"group:{previous_slug}"] if previous_slug else []),
+        *(f"profile:{username}" for username in authors),
+    )
+
+
+# Поля пользователя, которые видны в карточках постов.
+card_user_fields = ("username", "first_name", "last_name")
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields, **kwargs):
+    instance._previous_card_fields = None
+    if update_fields is not None and not (
+        set(update_fields) & set(card_user_fields)
+    ):
+        return
+    if instance.pk:
+        instance._previous_card_fields = User.objects.filter(
+            pk=instance.pk
+        ).values_list(*card_user_fields).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    """Имя автора в карточках: при его смене карточки и страницы с
+    постами автора собираются заново. Вход (update_fields=last_login)
+    ничего не сбрасывает.
+    """
+    previous = getattr(instance, "_previous_card_fields", None)
+    current = tuple(getattr(instance, field) for field in card_user_fields)
+    if created or previous is None or previous == current:
+        return
+    slugs = Group.objects.filter(
+        posts__author=instance
+    ).distinct().values_list("slug", flat=True)
+    bump_generations(
+        "index",
+        "articles",
+        f"profile:{previous[0]}",
+        f"profile:{instance.username}",
+        *(f"group:{slug}" for slug in slugs),
+    )
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_generations(f"profile:{instance.username}")
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_user(instance.user_id, following_count=1)
+        bump_user(instance.author_id, followers_count=1)
+        start_pulling(instance.author_id)
+        backfill_feed(instance.user_id, instance.author_id)
+        publish_follow(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_user(instance.user_id, following_count=-1)
+    bump_user(instance.author_id, followers_count=-1)
+    prune_feed(instance.user_id, instance.author_id)
+    publish_follow(instance)
+
+
+def publish_follow(follow):
+    """Подписка меняет данные обоих пользователей: их теги "user:<id>"."""
+    now_and_on_commit(
+        bus.publish,
+        tags=[f"user:{follow.user_id}", f"user:{follow.author_id}"],
+    )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        bump_post_comments(instance.post_id, 1)
+    now_and_on_commit(bus.publish, tags=[f"post:{instance.post_id}"])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_post_comments(instance.post_id, -1)
+    now_and_on_commit(bus.publish, tags=[f"post:{instance.post_id}"])
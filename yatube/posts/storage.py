@@ -0,0 +1,171 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+from .cache import acquire_lock, release_lock
+
+# Сколько уровней каталогов и по сколько символов хэша на уровень:
+# posts/ab/cd/abcd...png, не больше 256 подкаталогов на уровень.
+shard_depth: int = 2
+shard_width: int = 2
+chunk_size: int = 64 * 1024
+lock_timeout: int = 30
+lock_wait_step: float = 0.05
+# Сколько живёт заявка на файл, если транзакция загрузки не дошла
+# ни до коммита, ни до отката (процесс упал).
+claim_timeout: int = 60 * 10
+
+HEX_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+def file_digest(file):
+    """Размер и SHA-256 файла, читается кусками без загрузки в память."""
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    for chunk in file.chunks(chunk_size):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return size, digest.hexdigest()
+
+
+def hashed_name(name, content_hash):
+    """posts/photo.PNG -> posts/ab/cd/abcd...png"""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    shards = [
+        content_hash[level * shard_width:(level + 1) * shard_width]
+        for level in range(shard_depth)
+    ]
+    return "/".join(
+        part for part in (directory, *shards, content_hash + extension)
+        if part
+    )
+
+
+def is_hashed(name):
+    """Имя уже построено hashed_name."""
+    stem, extension = os.path.splitext(os.path.basename(name))
+    return (
+        HEX_DIGEST.fullmatch(stem) is not None
+        and name.endswith(hashed_name("", stem) + extension.lower())
+    )
+
+
+@contextmanager
+def image_lock(name):
+    """Блокировка файла на время проверки ссылок и удаления или
+    повторного использования; отдаёт False, если не дождалась.
+    """
+    lock = f"image:{name}"
+    deadline = time.monotonic() + lock_timeout
+    while not acquire_lock(lock, lock_timeout):
+        if time.monotonic() > deadline:
+            yield False
+            return
+        time.sleep(lock_wait_step)
+    try:
+        yield True
+    finally:
+        release_lock(lock)
+
+
+def claim_key(name):
+    return f"image-claim:{name}"
+
+
+def claim(name):
+    """Отмечает, что незакоммиченная транзакция ссылается на файл.
+
+    Заявка снимается после коммита; при откате она живёт
+    claim_timeout, и всё это время файл не удаляется.
+    """
+    key = claim_key(name)
+    cache.add(key, 0, claim_timeout)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, claim_timeout)
+    transaction.on_commit(lambda: unclaim(name))
+
+
+def unclaim(name):
+    try:
+        cache.decr(claim_key(name))
+    except ValueError:
+        pass
+
+
+def is_claimed(name):
+    return bool(cache.get(claim_key(name)))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы называются по SHA-256 содержимого и раскладываются по
+    вложенным каталогам.
+
+    Одинаковые загрузки попадают в один файл и повторно не пишутся.
+    На файл может ссылаться много постов, поэтому удаляется он через
+    release_image, когда ссылок не осталось.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        return self.store(name, content, file_digest(content)[1])
+
+    def store(self, name, content, content_hash):
+        """Сохраняет файл с уже посчитанным хэшем и возвращает имя.
+
+        Существующий файл используется повторно под блокировкой и с
+        заявкой: release_image не удалит его, пока пост с новой ссылкой
+        не закоммичен. Без блокировки файл не сохраняется: это
+        TimeoutError.
+        """
+        name = hashed_name(name, content_hash)
+        with image_lock(name) as locked:
+            if not locked:
+                raise TimeoutError(f"Файл {name} занят")
+            claim(name)
+            if self.exists(name):
+                return name
+            return self._save(name, content)
+
+    def _save(self, name, content):
+        """Пишет во временный файл рядом и атомарно переименовывает.
+
+        Параллельная загрузка того же содержимого перезапишет файл
+        теми же байтами, читатели не увидят его недописанным.
+        """
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                for chunk in content.chunks(chunk_size):
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        return name
@@ -0,0 +1,73 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Group, Post, User
+
+
+class PostAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pass"
+        )
+        cls.group = Group.objects.create(
+            title="Группа", slug="group", description="Описание"
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:posts_post_changelist")
+
+    def create_posts(self, count, text="Пост"):
+        return [
+            Post.objects.create(author=self.admin, group=self.group, text=text)
+            for _ in range(count)
+        ]
+
+    def test_search_uses_full_text_index(self):
+        """Поиск в админке находит формы слова через индекс"""
+        cat, = self.create_posts(1, "Кот спит")
+        self.create_posts(1, "Собака")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"q": "котами"})
+        self.assertEqual(list(response.context["cl"].result_list), [cat])
+        self.assertFalse(
+            any("LIKE" in query["sql"] for query in queries.captured_queries)
+        )
+
+    def test_unfiltered_list_is_not_counted(self):
+        """Без фильтров число постов оценивается без COUNT(*)"""
+        posts = self.create_posts(3)
+        with mock.patch("posts.paginator.exact_count_limit", 0):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+        self.assertEqual(response.context["cl"].result_count, posts[-1].pk)
+        self.assertFalse(
+            any(
+                'COUNT(*) AS "__count" FROM "posts_post"' in query["sql"]
+                for query in queries.captured_queries
+            )
+        )
+
+    def test_filtered_list_is_counted_exactly(self):
+        """Отфильтрованный список считается точно"""
+        self.create_posts(2, "Кот")
+        self.create_posts(1, "Собака")
+        with mock.patch("posts.paginator.exact_count_limit", 0):
+            response = self.client.get(self.url, {"q": "кот"})
+        self.assertEqual(response.context["cl"].result_count, 2)
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Число запросов страницы не зависит от числа постов"""
+        self.create_posts(1)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        self.create_posts(5)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url)
+        self.assertEqual(len(many), len(few))
@@ -0,0 +1,91 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="test-slug",
+            description="Тестовое описание",
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.reader_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client.force_login(self.reader)
+
+    def test_counters_follow_write_paths(self):
+        """Счётчики обновляются при создании поста, комментария, подписки"""
+        self.author_client.post(
+            reverse("posts:post_create"),
+            data={"text": "Тестовый пост", "group": self.group.id},
+        )
+        post = Post.objects.get()
+        self.reader_client.post(
+            reverse("posts:add_comment", kwargs={"post_id": post.id}),
+            data={"text": "Тестовый комментарий"},
+        )
+        self.reader_client.get(
+            reverse("posts:profile_follow", kwargs={"username": "author"})
+        )
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        author_stats = UserStats.objects.get(user=self.author)
+        reader_stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(reader_stats.following_count, 1)
+
+        self.reader_client.get(
+            reverse("posts:profile_unfollow", kwargs={"username": "author"})
+        )
+        post.delete()
+        self.group.refresh_from_db()
+        author_stats.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+
+    def test_detail_page_does_not_count_posts(self):
+        """Страница поста берёт число постов автора из счётчика"""
+        post = Post.objects.create(author=self.author, text="Тестовый пост")
+        with self.assertNumQueries(5):
+            response = self.reader_client.get(
+                reverse("posts:post_detail", kwargs={"post_id": post.id})
+            )
+        self.assertEqual(response.context["count_posts"], 1)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет расхождения"""
+        post = Post.objects.create(
+            author=self.author, text="Тестовый пост", group=self.group
+        )
+        Comment.objects.create(post=post, author=self.reader, text="Текст")
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(posts_count=7, followers_count=0)
+        Post.objects.update(comments_count=5)
+        Group.objects.update(posts_count=3)
+        call_command("reconcile_counters", stdout=StringIO())
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
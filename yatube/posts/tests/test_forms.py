@@ -107,6 +107,25 @@ class PostFormTests(TestCase):
             ).exists
         )
 
+    def test_create_post_stores_image_metadata(self):
+        """Размеры, объём и хэш картинки сохраняются при загрузке"""
+        self.post.image.seek(0)
+        content = self.post.image.read()
+        self.author_client.post(
+            reverse("posts:post_create"),
+            data={
+                "text": "Пост с картинкой",
+                "image": SimpleUploadedFile(
+                    "upload.gif", content, content_type="image/gif"
+                ),
+            },
+        )
+        post = Post.objects.get(text="Пост с картинкой")
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertEqual(post.image_size, len(content))
+        self.assertEqual(post.image_hash, self.post.image_hash)
+        self.assertEqual(len(post.image_hash), 64)
+
     def test_post_edit_for_guest_client(self):
         """Валидная форма изменяет запись в БД"""
         post_count = Post.objects.count()
@@ -0,0 +1,356 @@
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from threading import Thread
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from ..images import (
+    CARD_WIDTHS, MIME_TYPES, MODERN_FORMATS, THUMBNAIL_GEOMETRIES,
+    LockingThumbnailBackend, attach_gallery, attach_thumbnails,
+    pregenerate_thumbnails
+)
+from ..models import Post, PostImage, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(size=(40, 30), image_format="PNG"):
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, image_format)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.image_name = default_storage.save(
+            "posts/test.png", ContentFile(make_image())
+        )
+
+    def test_pregenerate_thumbnails(self):
+        """Фоновая генерация создаёт миниатюры, запрос их не пересоздаёт"""
+        pregenerate_thumbnails(self.image_name)
+        with mock.patch.object(default.engine, "create") as create:
+            for geometry, options in THUMBNAIL_GEOMETRIES:
+                thumbnail = get_thumbnail(self.image_name, geometry, **options)
+                self.assertTrue(thumbnail.exists())
+        create.assert_not_called()
+
+    def test_concurrent_generation_creates_thumbnail_once(self):
+        """Параллельные запросы не создают одну миниатюру дважды"""
+        backend = LockingThumbnailBackend()
+        source_image = default.engine.get_image(ImageFile(self.image_name))
+        options = dict(backend.default_options, crop="center")
+        calls = []
+        original_create = default.engine.create
+
+        def slow_create(*args, **kwargs):
+            calls.append(1)
+            time.sleep(0.2)
+            return original_create(*args, **kwargs)
+
+        def create_thumbnail():
+            backend._create_thumbnail(
+                source_image, "20x10", options,
+                ImageFile("cache/test/thumbnail.jpg", default.storage),
+            )
+
+        with mock.patch.object(default.engine, "create", slow_create):
+            threads = [Thread(target=create_thumbnail) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(default.storage.exists("cache/test/thumbnail.jpg"))
+
+    def test_attach_thumbnails_reads_metadata_in_one_call(self):
+        """Метаданные миниатюр страницы читаются одним get_many"""
+        author = User.objects.create_user(username="author")
+        posts = [
+            Post(author=author, text="Пост", image=self.image_name)
+            for _ in range(3)
+        ] + [Post(author=author, text="Без картинки")]
+        pregenerate_thumbnails(self.image_name, posts[0].image_width)
+        get_many = mock.patch.object(cache, "get_many", wraps=cache.get_many)
+        with mock.patch("posts.images.get_thumbnail") as sorl_lookup:
+            with get_many as get_many_mock:
+                attach_thumbnails(posts)
+        sorl_lookup.assert_not_called()
+        self.assertEqual(get_many_mock.call_count, 1)
+        self.assertEqual(posts[0].thumbnail["width"], 960)
+        self.assertEqual(posts[0].thumbnail["height"], 339)
+        self.assertIsNone(posts[-1].thumbnail)
+
+    def test_picture_has_responsive_variants(self):
+        """Картинка отдаётся набором ширин и в современных форматах"""
+        post = Post(
+            author=User.objects.create_user(username="author"),
+            text="Пост",
+            image=default_storage.save(
+                "posts/large.png", ContentFile(make_image((1200, 600)))
+            ),
+        )
+        picture = attach_thumbnails([post])[0].thumbnail
+        for width in CARD_WIDTHS:
+            self.assertIn(f" {width}w", picture["srcset"])
+        self.assertEqual(
+            [source["type"] for source in picture["sources"]],
+            [MIME_TYPES[image_format] for image_format in MODERN_FORMATS],
+        )
+        for source in picture["sources"]:
+            self.assertEqual(
+                len(source["srcset"].split(", ")), len(CARD_WIDTHS)
+            )
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_cold_image_is_not_resized_in_request(self):
+        """На промахе отдаётся оригинал, а варианты заказываются в фон"""
+        post = Post(
+            author=User.objects.create_user(username="author"),
+            text="Пост",
+            image=self.image_name,
+            image_width=40,
+            image_height=30,
+        )
+        with mock.patch("posts.images.get_thumbnail") as sorl_lookup, \
+                mock.patch("posts.images.get_executor") as executor:
+            attach_thumbnails([post])
+            attach_thumbnails([post])
+        sorl_lookup.assert_not_called()
+        executor().submit.assert_called_once()
+        self.assertEqual(post.thumbnail["url"], post.image.url)
+        self.assertEqual(
+            (post.thumbnail["width"], post.thumbnail["height"]), (40, 30)
+        )
+        self.assertTrue(post.thumbnail["pending"])
+
+    def test_small_image_is_not_upscaled_in_srcset(self):
+        """Варианты шире оригинала не создаются"""
+        post = Post(
+            author=User.objects.create_user(username="author"),
+            text="Пост",
+            image=self.image_name,
+            image_width=700,
+        )
+        picture = attach_thumbnails([post])[0].thumbnail
+        self.assertEqual(picture["width"], 640)
+        self.assertNotIn(" 960w", picture["srcset"])
+
+    def test_duplicate_images_share_metadata(self):
+        """Одинаковые картинки делят метаданные миниатюр по хэшу"""
+        author = User.objects.create_user(username="author")
+        first = Post.objects.create(
+            author=author,
+            text="Пост",
+            image=SimpleUploadedFile("same.png", make_image()),
+        )
+        second = Post(
+            author=author,
+            text="Старая копия",
+            image=self.image_name,
+            image_width=first.image_width,
+            image_hash=first.image_hash,
+        )
+        pregenerate_thumbnails(
+            first.image.name, first.image_width, first.image_hash
+        )
+        with mock.patch("posts.images.get_thumbnail") as sorl_lookup:
+            attach_thumbnails([second])
+        sorl_lookup.assert_not_called()
+
+    def test_rethumbnail_command_resumes_from_checkpoint(self):
+        """Команда создаёт миниатюры и продолжает с контрольной точки"""
+        author = User.objects.create_user(username="author")
+        posts = [
+            Post.objects.create(
+                author=author,
+                text="Пост",
+                image=SimpleUploadedFile(f"{i}.png", make_image((50 + i, 30))),
+            )
+            for i in range(3)
+        ]
+        checkpoint = f"{TEMP_MEDIA_ROOT}/rethumbnail.checkpoint"
+        with open(checkpoint, "w") as file:
+            file.write(str(posts[0].pk))
+        out = StringIO()
+        call_command(
+            "rethumbnail", workers=0, chunk_size=1,
+            checkpoint=checkpoint, stdout=out,
+        )
+        self.assertIn("Итого 2 картинок", out.getvalue())
+        with open(checkpoint) as file:
+            self.assertEqual(file.read(), str(posts[-1].pk))
+        with mock.patch("posts.images.get_thumbnail") as sorl_lookup:
+            attach_thumbnails(posts[1:])
+        sorl_lookup.assert_not_called()
+
+    def test_rethumbnail_command_covers_gallery(self):
+        """Команда создаёт миниатюры и для картинок галереи"""
+        author = User.objects.create_user(username="author")
+        post = Post.objects.create(author=author, text="Пост")
+        PostImage.objects.create(
+            post=post,
+            position=0,
+            image=SimpleUploadedFile("gallery.png", make_image((70, 30))),
+        )
+        cache.clear()
+        checkpoint = f"{TEMP_MEDIA_ROOT}/gallery.checkpoint"
+        out = StringIO()
+        call_command(
+            "rethumbnail", workers=0, checkpoint=checkpoint, stdout=out,
+        )
+        self.assertIn("Итого 1 картинок", out.getvalue())
+        image = PostImage.objects.get()
+        with open(f"{checkpoint}.gallery") as file:
+            self.assertEqual(file.read(), str(image.pk))
+        with mock.patch("posts.images.get_thumbnail") as sorl_lookup:
+            attach_thumbnails([image])
+        sorl_lookup.assert_not_called()
+        self.assertNotIn("pending", image.thumbnail)
+
+    def test_rethumbnail_force_recreates_wiped_files(self):
+        """С --force команда создаёт заново удалённые файлы миниатюр"""
+        author = User.objects.create_user(username="author")
+        post = Post.objects.create(
+            author=author,
+            text="Пост",
+            image=SimpleUploadedFile("wiped.png", make_image((50, 30))),
+        )
+        call_command("rethumbnail", workers=0, stdout=StringIO())
+        attach_thumbnails([post])
+        thumbnail = post.thumbnail["url"].replace(
+            settings.MEDIA_URL, "", 1
+        )
+        default_storage.delete(thumbnail)
+        call_command("rethumbnail", workers=0, stdout=StringIO())
+        self.assertFalse(default_storage.exists(thumbnail))
+        call_command("rethumbnail", workers=0, force=True, stdout=StringIO())
+        self.assertTrue(default_storage.exists(thumbnail))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GalleryTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def add_images(self, post, count):
+        for position in range(count):
+            PostImage.objects.create(
+                post=post,
+                position=position,
+                image=SimpleUploadedFile(
+                    f"{position}.png", make_image((40 + position, 30))
+                ),
+            )
+
+    def test_create_post_with_gallery(self):
+        """Картинки галереи сохраняются по порядку с метаданными"""
+        self.client.post(
+            reverse("posts:post_create"),
+            {
+                "text": "Пост",
+                "gallery": [
+                    SimpleUploadedFile(
+                        "a.png", make_image((41, 30)), "image/png"
+                    ),
+                    SimpleUploadedFile(
+                        "b.png", make_image((42, 30)), "image/png"
+                    ),
+                ],
+            },
+        )
+        post = Post.objects.get()
+        self.assertEqual(post.gallery_count, 2)
+        self.assertEqual(
+            [(image.position, image.image_width)
+             for image in post.gallery.all()],
+            [(0, 41), (1, 42)],
+        )
+        self.assertEqual(len(post.gallery.first().image_hash), 64)
+
+    @override_settings(MAX_GALLERY_IMAGES=1)
+    def test_gallery_size_is_limited(self):
+        """Картинок в галерее не больше MAX_GALLERY_IMAGES"""
+        response = self.client.post(
+            reverse("posts:post_create"),
+            {
+                "text": "Пост",
+                "gallery": [
+                    SimpleUploadedFile("a.png", make_image(), "image/png"),
+                    SimpleUploadedFile(
+                        "b.png", make_image((41, 30)), "image/png"
+                    ),
+                ],
+            },
+        )
+        self.assertIn("gallery", response.context["gallery_form"].errors)
+        self.assertFalse(Post.objects.exists())
+
+    def test_page_galleries_are_read_in_one_query(self):
+        """Галереи всей страницы читаются одним запросом"""
+        posts = [
+            Post.objects.create(author=self.author, text=f"Пост {i}")
+            for i in range(3)
+        ]
+        self.add_images(posts[0], 2)
+        self.add_images(posts[2], 1)
+        page = list(Post.objects.filter(pk__in=[p.pk for p in posts]))
+        with self.assertNumQueries(1):
+            images = attach_gallery(page)
+        self.assertEqual(len(images), 3)
+        gallery = {post.pk: post.gallery_images for post in page}
+        self.assertEqual(len(gallery[posts[0].pk]), 2)
+        self.assertEqual(gallery[posts[1].pk], [])
+        without_gallery = [posts[1]]
+        with self.assertNumQueries(0):
+            attach_gallery(without_gallery)
+
+    def test_gallery_thumbnails_are_lazy(self):
+        """Миниатюры галереи грузятся лениво, основная картинка - нет"""
+        post = Post.objects.create(
+            author=self.author,
+            text="Пост",
+            image=SimpleUploadedFile("main.png", make_image((60, 30))),
+        )
+        self.add_images(post, 2)
+        content = self.client.get(
+            reverse("posts:post_detail", args=(post.pk,))
+        ).content.decode()
+        self.assertEqual(content.count('loading="lazy"'), 2)
+        self.assertEqual(content.count("<picture>"), 3)
+
+    def test_deleted_gallery_image_updates_counter(self):
+        """Удаление картинки галереи уменьшает счётчик поста"""
+        post = Post.objects.create(author=self.author, text="Пост")
+        self.add_images(post, 2)
+        post.gallery.first().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.gallery_count, 1)
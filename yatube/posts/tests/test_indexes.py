@@ -0,0 +1,88 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN из SQLite")
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="Тестовая группа",
+            slug="test-slug",
+            description="Тестовое описание",
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f"Пост {i}"
+            )
+        cls.post = Post.objects.latest("pub_date")
+        for i in range(25):
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f"Комментарий {i}"
+            )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def get_ordered_queries(self, url, next_url=None, page="page_obj"):
+        """SELECT-запросы страницы с ORDER BY, включая вторую страницу."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+            self.client.get(
+                next_url or url,
+                {"cursor": response.context[page].next_cursor},
+            )
+        return [
+            query["sql"] for query in context.captured_queries
+            if query["sql"].startswith("SELECT") and "ORDER BY" in query["sql"]
+        ]
+
+    def test_feed_queries_avoid_temp_sort(self):
+        """Основные запросы лент читают индекс без сортировки во временном
+        B-дереве."""
+        urls = [
+            (reverse("posts:index"), None, "page_obj"),
+            (
+                reverse("posts:group_list", kwargs={"slug": self.group.slug}),
+                None,
+                "page_obj",
+            ),
+            (
+                reverse("posts:profile", kwargs={"username": "author"}),
+                None,
+                "page_obj",
+            ),
+            (reverse("posts:follow_index"), None, "page_obj"),
+            (
+                reverse("posts:post_detail", kwargs={"post_id": self.post.id}),
+                reverse(
+                    "posts:post_comments", kwargs={"post_id": self.post.id}
+                ),
+                "comments",
+            ),
+        ]
+        for url, next_url, page in urls:
+            queries = self.get_ordered_queries(url, next_url, page)
+            self.assertTrue(queries)
+            for sql in queries:
+                with self.subTest(url=url, sql=sql):
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                        plan = " ".join(str(row) for row in cursor)
+                    self.assertNotIn("TEMP B-TREE", plan)
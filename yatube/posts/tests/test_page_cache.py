@@ -0,0 +1,147 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.db import transaction
+from django.test import (
+    Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+)
+from django.urls import reverse
+
+from ..cache import (
+    acquire_lock, bump_generations, cache_page_by_generation,
+    generation_key, get_generations, page_key, release_lock
+)
+from ..models import Group, User
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.broken = False
+        self.missing = False
+        self.page = cache_page_by_generation(60, "test_page", "test")(
+            self.view
+        )
+        self.factory = RequestFactory()
+
+    def view(self, request):
+        if self.missing:
+            raise Http404("Страницы больше нет")
+        if self.broken:
+            raise RuntimeError("База не отвечает")
+        self.calls += 1
+        return HttpResponse(f"версия {self.calls}")
+
+    def get(self):
+        return self.page(self.factory.get("/page/")).content.decode()
+
+    def expire(self):
+        entry = cache.get(self.key())
+        entry["expires"] = time.time() - 1
+        cache.set(self.key(), entry)
+
+    def test_fresh_copy_is_served_from_cache(self):
+        """Свежая копия отдаётся без вызова view"""
+        self.assertEqual(self.get(), "версия 1")
+        self.assertEqual(self.get(), "версия 1")
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_copy_served_while_another_request_rebuilds(self):
+        """Пока страницу пересобирает другой запрос, отдаётся старая копия"""
+        self.get()
+        self.assertTrue(acquire_lock(f"page:{self.key()}", 30))
+        self.expire()
+        self.assertEqual(self.get(), "версия 1")
+        self.assertEqual(self.calls, 1)
+        release_lock(f"page:{self.key()}")
+        self.assertEqual(self.get(), "версия 2")
+
+    def test_generation_bump_rebuilds_page(self):
+        """После сброса поколения страница собирается заново"""
+        self.get()
+        bump_generations("test")
+        self.assertEqual(self.get(), "версия 2")
+
+    def test_early_expiry(self):
+        """Долгая страница обновляется раньше срока"""
+        self.get()
+        entry = cache.get(self.key())
+        entry["delta"] = 100
+        cache.set(self.key(), entry)
+        with mock.patch("posts.cache.random.random", return_value=0.9):
+            self.assertEqual(self.get(), "версия 2")
+
+    def test_stale_if_error(self):
+        """Если view падает, отдаётся устаревшая копия"""
+        self.get()
+        self.broken = True
+        self.expire()
+        self.assertEqual(self.get(), "версия 1")
+        cache.clear()
+        with self.assertRaises(RuntimeError):
+            self.get()
+
+    def test_not_found_is_not_hidden_by_stale_copy(self):
+        """404 не подменяется устаревшей копией, и копия удаляется"""
+        self.get()
+        self.missing = True
+        self.expire()
+        with self.assertRaises(Http404):
+            self.get()
+        self.assertIsNone(cache.get(self.key()))
+
+    def key(self):
+        return page_key("test", "test_page", self.factory.get("/page/"))
+
+
+class GenerationKeyTests(SimpleTestCase):
+    def test_key_is_ascii(self):
+        """Ключ поколения годится для memcached при кириллице в области"""
+        key = generation_key("profile:лев")
+        self.assertTrue(key.isascii())
+        self.assertTrue(key.startswith("generation:profile:"))
+
+
+class DeletedPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_browser_does_not_keep_page(self):
+        """Браузер не хранит страницу столько, сколько сервер"""
+        response = self.client.get(reverse("posts:index"))
+        self.assertIn("max-age=0", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+        self.assertFalse(response.has_header("Expires"))
+
+    def test_deleted_group_page_is_not_served(self):
+        """Страница удалённой группы отдаёт 404, а не копию из кэша"""
+        group = Group.objects.create(
+            title="Группа", slug="g", description="Описание"
+        )
+        url = reverse("posts:group_list", args=["g"])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        group.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_deleted_profile_page_is_not_served(self):
+        """Профиль удалённого пользователя отдаёт 404"""
+        user = User.objects.create_user(username="a")
+        url = reverse("posts:profile", args=["a"])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        user.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class InvalidationOnCommitTests(TransactionTestCase):
+    def test_generation_is_bumped_again_after_commit(self):
+        """Копия, собранная до коммита, сбрасывается после него"""
+        with transaction.atomic():
+            bump_generations("test")
+            before_commit, = get_generations(["test"])
+        after_commit, = get_generations(["test"])
+        self.assertNotEqual(after_commit, before_commit)
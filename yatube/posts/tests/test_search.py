@@ -0,0 +1,98 @@
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Post, User
+from ..search import SearchPaginator, build_match
+from ..views import set_limit
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author")
+
+    def setUp(self):
+        self.client = Client()
+
+    def search(self, query, cursor=None):
+        return SearchPaginator(query, set_limit).get_page(cursor)
+
+    def test_inflected_forms_are_found(self):
+        """Поиск находит другие формы слова и ё по е"""
+        cat = Post.objects.create(author=self.author, text="Кот спит")
+        kittens = Post.objects.create(
+            author=self.author, text="Много котиков"
+        )
+        hedgehog = Post.objects.create(author=self.author, text="Ёжик")
+        Post.objects.create(author=self.author, text="Собака")
+        self.assertEqual(
+            {post.pk for post in self.search("котами")}, {cat.pk, kittens.pk}
+        )
+        self.assertEqual([post.pk for post in self.search("ежика")],
+                         [hedgehog.pk])
+
+    def test_results_are_ranked(self):
+        """Пост, где слово встречается чаще, выше в выдаче"""
+        rare = Post.objects.create(
+            author=self.author, text="Кот и ещё много разных слов"
+        )
+        often = Post.objects.create(author=self.author, text="Кот кот кот")
+        self.assertEqual(
+            [post.pk for post in self.search("кот")], [often.pk, rare.pk]
+        )
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        """В фрагменте подсвечены найденные слова, HTML экранирован"""
+        Post.objects.create(
+            author=self.author, text="<script>alert(1)</script> про кота"
+        )
+        response = self.client.get(reverse("posts:search"), {"q": "кот"})
+        self.assertContains(response, "<mark>кота</mark>")
+        self.assertNotContains(response, "<script>alert")
+
+    def test_keyset_pagination(self):
+        """Страницы выдачи идут по ключу без повторов и пропусков"""
+        Post.objects.bulk_create(
+            Post(author=self.author, text="кот " * (i % 3 + 1))
+            for i in range(set_limit + 3)
+        )
+        for post in Post.objects.all():
+            post.save()
+        first = self.search("кот")
+        second = self.search("кот", first.next_cursor)
+        back = self.search("кот", second.previous_cursor)
+        ids = [post.pk for post in first] + [post.pk for post in second]
+        self.assertEqual(len(first), set_limit)
+        self.assertEqual(sorted(ids), sorted(Post.objects.values_list(
+            "pk", flat=True
+        )))
+        self.assertIsNone(second.next_cursor)
+        self.assertEqual(
+            [post.pk for post in back], [post.pk for post in first]
+        )
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста"""
+        post = Post.objects.create(author=self.author, text="Кот")
+        post.text = "Собака"
+        post.save()
+        self.assertEqual(list(self.search("кот")), [])
+        self.assertEqual(len(self.search("собака")), 1)
+        post.delete()
+        self.assertEqual(list(self.search("собака")), [])
+
+    def test_search_page_queries(self):
+        """Страница поиска - запрос к индексу и запрос карточек"""
+        Post.objects.create(author=self.author, text="Кот")
+        with self.assertNumQueries(2):
+            self.client.get(reverse("posts:search"), {"q": "кот"})
+        with self.assertNumQueries(0):
+            self.client.get(reverse("posts:search"), {"q": "  "})
+
+    def test_query_syntax_is_not_passed_through(self):
+        """Операторы FTS5 в запросе не ломают поиск"""
+        self.assertEqual(build_match('кот" OR NEAR(*'), '"кот"* "or"* "near"*')
+        response = self.client.get(
+            reverse("posts:search"), {"q": 'кот" OR NEAR(*'}
+        )
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,141 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from ..images import card_widths, thumbnail_key
+from ..models import Post, User
+from ..storage import file_digest, hashed_name, is_claimed, is_hashed
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04"
+    b"\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02"
+    b"\x02\x4c\x01\x00\x3b"
+)
+
+
+def upload(name="small.gif", content=SMALL_GIF):
+    return SimpleUploadedFile(name, content, content_type="image/gif")
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author")
+        self.storage = Post._meta.get_field("image").storage
+
+    def test_identical_uploads_share_one_sharded_file(self):
+        """Одинаковые загрузки хранятся одним файлом во вложенных папках"""
+        first, second = (
+            Post.objects.create(
+                author=self.author, text="Пост", image=upload(name)
+            )
+            for name in ("one.GIF", "two.gif")
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        digest = first.image_hash
+        self.assertEqual(
+            first.image.name, f"posts/{digest[:2]}/{digest[2:4]}/{digest}.gif"
+        )
+        self.assertTrue(is_hashed(first.image.name))
+        self.assertTrue(self.storage.exists(first.image.name))
+
+    @mock.patch("posts.storage.lock_timeout", 0)
+    @mock.patch("posts.storage.acquire_lock", return_value=False)
+    def test_busy_file_is_not_saved_without_lock(self, acquire_lock):
+        """Без блокировки файл не сохраняется и не заявляется"""
+        image = upload()
+        name = hashed_name("busy/busy.gif", file_digest(image)[1])
+        with self.assertRaises(TimeoutError):
+            self.storage.save("busy/busy.gif", image)
+        self.assertFalse(is_claimed(name))
+        self.assertFalse(self.storage.exists(name))
+
+    def test_migrate_images_moves_flat_files(self):
+        """Команда переносит старые файлы и склеивает одинаковые"""
+        names = [
+            self.storage._save(
+                f"posts/{name}.gif", ContentFile(SMALL_GIF + b"\x01")
+            )
+            for name in ("old", "copy")
+        ]
+        for name in names:
+            Post.objects.create(author=self.author, text="Пост", image=name)
+        out = StringIO()
+        call_command("migrate_images", stdout=out)
+        self.assertIn(
+            "Перенесено: 2, совпало с уже сохранёнными: 1", out.getvalue()
+        )
+        hashed = set(Post.objects.values_list("image", flat=True))
+        self.assertEqual(len(hashed), 1)
+        self.assertTrue(is_hashed(hashed.pop()))
+        for name in names:
+            self.assertFalse(self.storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageReferenceTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # Заявки на файлы из TestCase, где on_commit не вызывается.
+        cache.clear()
+        self.author = User.objects.create_user(username="author")
+        self.storage = Post._meta.get_field("image").storage
+
+    def test_file_is_deleted_with_last_reference(self):
+        """Файл удаляется только вместе с последним постом"""
+        first, second = (
+            Post.objects.create(
+                author=self.author, text="Пост", image=upload()
+            )
+            for _ in range(2)
+        )
+        name = first.image.name
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+        second.image = upload(content=SMALL_GIF + b"\x00")
+        second.save()
+        self.assertFalse(self.storage.exists(name))
+        self.assertTrue(self.storage.exists(second.image.name))
+
+    def test_thumbnail_metadata_is_forgotten(self):
+        """С файлом удаляются и метаданные его миниатюр"""
+        post = Post.objects.create(
+            author=self.author, text="Пост", image=upload()
+        )
+        key = thumbnail_key(
+            post.image.name, card_widths(post.image_width), post.image_hash
+        )
+        cache.set(key, {"url": "/media/cache/old.jpg"})
+        post.delete()
+        self.assertIsNone(cache.get(key))
+
+    def test_file_claimed_by_pending_upload_is_kept(self):
+        """Файл не удаляется, пока загрузка того же содержимого
+        не закоммичена
+        """
+        post = Post.objects.create(
+            author=self.author, text="Пост", image=upload()
+        )
+        name = post.image.name
+        with mock.patch("posts.storage.transaction.on_commit"):
+            self.assertEqual(self.storage.save("posts/x.gif", upload()), name)
+        post.delete()
+        self.assertTrue(self.storage.exists(name))
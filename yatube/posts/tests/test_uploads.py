@@ -0,0 +1,141 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..models import Post, User
+from ..uploads import copy_jpeg_without_app1
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+GPS_INFO = 0x8825
+
+
+def make_upload(size=(40, 30), image_format="JPEG", exif=None, mode="RGB"):
+    buffer = BytesIO()
+    options = {"exif": exif} if exif else {}
+    Image.new(mode, size).save(buffer, image_format, **options)
+    content_type = f"image/{image_format.lower()}"
+    return SimpleUploadedFile(
+        f"upload.{image_format.lower()}", buffer.getvalue(), content_type
+    )
+
+
+def exif_with_gps(orientation=1):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[GPS_INFO] = {1: "N", 2: (55.0, 45.0, 0.0)}
+    return exif.tobytes()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="author")
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.author)
+        self.client.get(reverse("posts:post_create"))
+        self.csrf_token = self.client.cookies["csrftoken"].value
+
+    def create(self, image):
+        return self.client.post(
+            reverse("posts:post_create"),
+            {
+                "text": "Пост",
+                "image": image,
+                "csrfmiddlewaretoken": self.csrf_token,
+            },
+        )
+
+    def test_csrf_is_still_checked(self):
+        """Загрузка без CSRF-токена отклоняется"""
+        response = self.client.post(
+            reverse("posts:post_create"),
+            {"text": "Пост", "image": make_upload()},
+        )
+        self.assertTemplateUsed(response, "core/403csrf.html")
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(MAX_IMAGE_UPLOAD_SIZE=1024)
+    def test_large_upload_is_rejected(self):
+        """Файл больше лимита отклоняется с ошибкой формы"""
+        response = self.create(make_upload(size=(400, 400), mode="L"))
+        errors = response.context["form"].errors["image"]
+        self.assertIn("Картинка больше", errors[0])
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(MAX_IMAGE_PIXELS=100 * 100)
+    def test_decompression_bomb_is_rejected_by_header(self):
+        """Картинка с огромным числом пикселей отклоняется по заголовку"""
+        response = self.create(
+            make_upload(size=(2000, 2000), image_format="PNG", mode="1")
+        )
+        errors = response.context["form"].errors["image"]
+        self.assertIn("слишком большая", errors[0])
+        self.assertFalse(Post.objects.exists())
+
+    def test_not_an_image_is_rejected(self):
+        """Не картинка отклоняется до записи в хранилище"""
+        response = self.create(
+            SimpleUploadedFile("evil.jpg", b"<?php", "image/jpeg")
+        )
+        self.assertFormError(
+            response, "form", "image", "Файл не является картинкой."
+        )
+
+    def test_exif_is_stripped_without_reencoding(self):
+        """EXIF удаляется, сжатые данные JPEG не меняются"""
+        upload = make_upload(exif=exif_with_gps())
+        original = upload.read()
+        upload.seek(0)
+        self.create(upload)
+        post = Post.objects.get()
+        with post.image.open() as stored:
+            content = stored.read()
+        self.assertNotIn(b"Exif\x00\x00", content)
+        scan = original.index(b"\xff\xda")
+        self.assertTrue(content.endswith(original[scan:]))
+        self.assertEqual(Image.open(BytesIO(content)).size, (40, 30))
+        self.assertEqual(post.image_size, len(content))
+
+    def test_rotated_jpeg_is_reencoded_upright(self):
+        """JPEG с поворотом в EXIF пересжимается уже повёрнутым"""
+        self.create(make_upload(exif=exif_with_gps(orientation=6)))
+        post = Post.objects.get()
+        with post.image.open() as stored:
+            image = Image.open(BytesIO(stored.read()))
+        self.assertEqual(image.size, (30, 40))
+        self.assertNotIn(GPS_INFO, image.getexif())
+
+    def test_jpeg_fill_bytes_are_skipped(self):
+        """Байт-заполнитель 0xFF перед маркером не ломает очистку EXIF"""
+        upload = make_upload(exif=exif_with_gps())
+        original = upload.read()
+        filled = original[:2] + b"\xff" + original[2:]
+        response = self.create(
+            SimpleUploadedFile("filled.jpg", filled, "image/jpeg")
+        )
+        self.assertEqual(response.status_code, 302)
+        with Post.objects.get().image.open() as stored:
+            content = stored.read()
+        self.assertNotIn(b"Exif\x00\x00", content)
+        scan = original.index(b"\xff\xda")
+        self.assertTrue(content.endswith(original[scan:]))
+
+    def test_truncated_jpeg_segment_is_reported(self):
+        """Обрезанный сегмент - ValueError, а не struct.error"""
+        original = make_upload(exif=exif_with_gps()).read()
+        app1 = original.index(b"\xff\xe1")
+        for cut in (app1 + 3, app1 + 10):
+            with self.subTest(cut=cut):
+                with self.assertRaises(ValueError):
+                    copy_jpeg_without_app1(BytesIO(original[:cut]), BytesIO())
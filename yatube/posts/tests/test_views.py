@@ -1,6 +1,6 @@
 from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
-from ..models import Post, Group, Follow, Comment
+from ..models import Post, Group, Follow, Comment, FeedEntry, UserStats
 from django.urls import reverse
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -8,6 +8,13 @@ import shutil
 import tempfile
 from django.conf import settings
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ..articles import article_key
+from ..cache import get_generations
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
 
 
 User = get_user_model()
@@ -123,17 +130,126 @@ class PostViewsTests(TestCase):
         add_content = self.author_client.get(
             reverse("posts:index")
         ).content
-        post.delete()
-        delete_content = self.author_client.get(
+        Post.objects.filter(pk=post.pk).update(text="Изменён в обход ORM")
+        cached_content = self.author_client.get(
             reverse("posts:index")
         ).content
-        self.assertEqual(add_content, delete_content)
+        self.assertEqual(add_content, cached_content)
         cache.clear()
         cache_clear_content = self.author_client.get(
             reverse("posts:index")
         ).content
         self.assertNotEqual(add_content, cache_clear_content)
 
+    def test_cache_invalidated_on_post_changes(self):
+        """Изменение поста сбрасывает кэш ленты, группы и профиля"""
+        pages = [
+            reverse("posts:index"),
+            reverse("posts:group_list", kwargs={
+                "slug": PostViewsTests.group.slug
+            }),
+            reverse("posts:profile", kwargs={
+                "username": PostViewsTests.author.username
+            }),
+        ]
+        post = Post.objects.create(
+            text="Пост для сброса кэша",
+            author=self.author,
+            group=self.group
+        )
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertContains(
+                    self.guest_client.get(page), "Пост для сброса кэша"
+                )
+        post.text = "Отредактированный пост"
+        post.save()
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertContains(
+                    self.guest_client.get(page), "Отредактированный пост"
+                )
+        post.delete()
+        for page in pages:
+            with self.subTest(page=page):
+                self.assertNotContains(
+                    self.guest_client.get(page), "Отредактированный пост"
+                )
+
+    def test_cached_page_shared_with_personal_header(self):
+        """Общая копия страницы дополняется шапкой пользователя"""
+        author_content = self.author_client.get(
+            reverse("posts:index")
+        ).content.decode()
+        Post.objects.filter(pk=self.post.pk).update(text="Изменён в обход ORM")
+        auth_content = self.authorized_client.get(
+            reverse("posts:index")
+        ).content.decode()
+        guest_content = self.guest_client.get(
+            reverse("posts:index")
+        ).content.decode()
+        self.assertIn("Тестовый пост", auth_content)
+        self.assertIn("Пользователь: author", author_content)
+        self.assertIn("Пользователь: auth", auth_content)
+        self.assertIn("Войти", guest_content)
+        self.assertNotIn("<!--hole:", guest_content)
+
+    def test_cached_profile_follow_button(self):
+        """Кнопка подписки в закэшированном профиле персональна"""
+        url = reverse("posts:profile", kwargs={
+            "username": PostViewsTests.author.username
+        })
+        self.assertContains(self.authorized_client.get(url), "Подписаться")
+        Follow.objects.create(user=self.auth, author=self.author)
+        self.assertContains(self.authorized_client.get(url), "Отписаться")
+        self.assertNotContains(self.author_client.get(url), "Подписаться")
+
+    def test_article_fragments_cached_per_post(self):
+        """Карточки постов берутся из кэша и обновляются после правки"""
+        self.guest_client.get(reverse("posts:index"))
+        post = Post.objects.get(pk=self.post.pk)
+        generation, = get_generations(["articles"])
+        key = article_key(post.id, post.updated, generation)
+        self.assertIn("Тестовый пост", cache.get(key))
+        self.author_client.post(
+            reverse("posts:post_edit", kwargs={"post_id": post.id}),
+            data={"text": "Правка поста", "group": self.group.id},
+        )
+        self.assertIsNone(cache.get(key))
+        response = self.guest_client.get(reverse("posts:group_list", kwargs={
+            "slug": self.group.slug
+        }))
+        self.assertContains(response, "Правка поста")
+
+    def test_group_slug_change_drops_old_page(self):
+        """После смены slug старый адрес группы отдаёт 404"""
+        group = Group.objects.create(
+            title="Старая", slug="old-slug", description="Описание"
+        )
+        old_url = reverse("posts:group_list", kwargs={"slug": "old-slug"})
+        self.assertEqual(self.guest_client.get(old_url).status_code, 200)
+        group.slug = "new-slug"
+        group.save()
+        self.assertEqual(self.guest_client.get(old_url).status_code, 404)
+
+    def test_author_rename_refreshes_cards(self):
+        """После смены имени автора карточки и страницы собираются заново"""
+        group_url = reverse("posts:group_list", kwargs={
+            "slug": self.group.slug
+        })
+        self.guest_client.get(group_url)
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name, author.last_name = "Лев", "Толстой"
+        author.save()
+        self.assertContains(self.guest_client.get(group_url), "Лев Толстой")
+
+    def test_login_does_not_reset_cards(self):
+        """Вход пользователя не сбрасывает кэш карточек"""
+        generation, = get_generations(["articles"])
+        author = User.objects.get(pk=self.author.pk)
+        author.save(update_fields=["last_login"])
+        self.assertEqual(get_generations(["articles"]), [generation])
+
     def test_pages_uses_correct_template_for_auth_client(self):
         """URL-адрес использует соответствующий шаблон."""
         name_template = {
@@ -291,6 +407,92 @@ class PostViewsTests(TestCase):
         )
         self.assertNotIn(self.post, response.context["page_obj"].object_list)
 
+    def test_new_post_fan_out_to_followers(self):
+        """Новый пост автора попадает в ленту подписчика"""
+        Follow.objects.create(
+            user=self.auth,
+            author=self.author
+        )
+        post = Post.objects.create(
+            text="Пост после подписки",
+            author=self.author
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.auth, post=post).exists()
+        )
+        response = self.authorized_client.get(
+            reverse("posts:follow_index")
+        )
+        self.assertEqual(response.context["page_obj"][0], post)
+
+    @override_settings(FEED_FANOUT_THRESHOLD=0)
+    def test_popular_author_posts_pulled_on_read(self):
+        """Посты популярного автора не раскладываются, а читаются слиянием"""
+        Follow.objects.create(
+            user=self.auth,
+            author=self.author
+        )
+        post = Post.objects.create(
+            text="Пост популярного автора",
+            author=self.author
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.auth).exists())
+        response = self.authorized_client.get(
+            reverse("posts:follow_index")
+        )
+        self.assertEqual(
+            list(response.context["page_obj"].object_list),
+            [post, self.post]
+        )
+
+    @override_settings(FEED_FANOUT_THRESHOLD=1)
+    def test_author_back_under_threshold_is_backfilled(self):
+        """Когда автор опускается до порога, его посты догружаются
+        в ленты, а режим переключается один раз
+        """
+        reader = User.objects.create_user(username="reader")
+        for user in (self.auth, reader):
+            Follow.objects.create(user=user, author=self.author)
+        self.assertTrue(UserStats.objects.get(user=self.author).feed_pulled)
+        post = Post.objects.create(text="Пост", author=self.author)
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        with mock.patch(
+            "posts.feeds.transaction.on_commit", lambda func: func()
+        ):
+            Follow.objects.filter(user=reader).delete()
+        self.assertFalse(UserStats.objects.get(user=self.author).feed_pulled)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.auth, post=post).exists()
+        )
+
+    def test_threshold_change_applied_by_reconcile(self):
+        """reconcile_counters переключает режим лент по новому порогу"""
+        Follow.objects.create(user=self.auth, author=self.author)
+        with override_settings(FEED_FANOUT_THRESHOLD=0):
+            call_command("reconcile_counters", stdout=StringIO())
+        self.assertTrue(UserStats.objects.get(user=self.author).feed_pulled)
+        post = Post.objects.create(text="Пост", author=self.author)
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        call_command("reconcile_counters", stdout=StringIO())
+        self.assertFalse(UserStats.objects.get(user=self.author).feed_pulled)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.auth, post=post).exists()
+        )
+
+    def test_unfollow_prunes_feed(self):
+        """После отписки посты автора удаляются из ленты"""
+        Follow.objects.create(
+            user=self.auth,
+            author=self.author
+        )
+        self.authorized_client.get(
+            reverse(
+                "posts:profile_unfollow",
+                kwargs={"username": self.author}
+            )
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.auth).exists())
+
     def test_follow_author_for_author(self):
         "Проверка подписки автора на самого себя"
         follow_count = Follow.objects.count()
@@ -314,6 +516,44 @@ class PostViewsTests(TestCase):
         self.assertEqual(Follow.objects.count(), follow_count)
 
 
+class CommentsViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.post = Post.objects.create(author=cls.author, text="Тестовый пост")
+        commentators = [
+            User.objects.create_user(username=f"user{i}") for i in range(25)
+        ]
+        for i, user in enumerate(commentators):
+            Comment.objects.create(
+                post=cls.post, author=user, text=f"Комментарий #{i}"
+            )
+
+    def test_comments_paginated_without_n_plus_one(self):
+        """Комментарии выводятся порциями одним запросом с авторами."""
+        url = reverse("posts:post_detail", kwargs={"post_id": self.post.id})
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        comments = response.context["comments"]
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, "Комментарий #0")
+        self.assertContains(response, "Показать ещё")
+
+        with self.assertNumQueries(2):
+            more = self.client.get(
+                reverse(
+                    "posts:post_comments", kwargs={"post_id": self.post.id}
+                ),
+                {"cursor": comments.next_cursor},
+            )
+        self.assertEqual(
+            [comment.text for comment in more.context["comments"]],
+            [f"Комментарий #{i}" for i in range(20, 25)]
+        )
+        self.assertNotContains(more, "Показать ещё")
+
+
 class PaginatorViewsTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -351,15 +591,59 @@ class PaginatorViewsTest(TestCase):
         ]
         for page in pages:
             with self.subTest(page=page):
-                response = len(self.guest_client.get(
-                    page).context.get('page_obj'))
+                page_obj = self.guest_client.get(
+                    page).context.get('page_obj')
                 self.assertEqual(
-                    response,
+                    len(page_obj),
                     posts_on_first_page
                 )
                 response = len(self.guest_client.get(
-                    page + '?page=2').context.get('page_obj'))
+                    page, {'cursor': page_obj.next_cursor}
+                ).context.get('page_obj'))
                 self.assertEqual(
                     response,
                     posts_on_second_page
                 )
+
+    def test_paginator_previous_cursor(self):
+        """Курсор назад возвращает на предыдущую страницу."""
+        page = reverse('posts:index')
+        first_page = self.guest_client.get(page).context.get('page_obj')
+        second_page = self.guest_client.get(
+            page, {'cursor': first_page.next_cursor}
+        ).context.get('page_obj')
+        self.assertIsNone(second_page.next_cursor)
+        previous_page = self.guest_client.get(
+            page, {'cursor': second_page.previous_cursor}
+        ).context.get('page_obj')
+        self.assertEqual(
+            list(previous_page.object_list),
+            list(first_page.object_list)
+        )
+        self.assertIsNone(previous_page.previous_cursor)
+
+    def test_paginator_page_navigation_without_count(self):
+        """has_next/has_previous берутся из выборки, без COUNT(*)."""
+        page = reverse('posts:index')
+        with CaptureQueriesContext(connection) as queries:
+            first_page = self.guest_client.get(page).context.get('page_obj')
+            self.assertTrue(first_page.has_next())
+            self.assertFalse(first_page.has_previous())
+            self.assertEqual(first_page.paginator.num_pages, 2)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries.captured_queries
+        ))
+        second_page = self.guest_client.get(
+            page, {'cursor': first_page.next_cursor}
+        ).context.get('page_obj')
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(second_page.has_previous())
+        self.assertEqual(second_page.start_index(), 11)
+        self.assertEqual(second_page.end_index(), 13)
+
+    def test_paginator_broken_cursor(self):
+        """Битый курсор отдаёт первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': 'broken'}
+        )
+        self.assertEqual(len(response.context.get('page_obj')), 10)
@@ -0,0 +1,67 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+
+from ..cache import page_key
+from ..models import Follow, Group, Post, User
+from ..warmup import hottest_paths, warm_on_boot
+
+
+class WarmCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.big = Group.objects.create(
+            title="Большая", slug="big", description="Описание"
+        )
+        cls.small = Group.objects.create(
+            title="Маленькая", slug="small", description="Описание"
+        )
+        for group in (cls.big, cls.big, cls.small):
+            Post.objects.create(author=cls.author, group=group, text="Пост")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hottest_paths(self):
+        """Сначала главная, затем группы и профили по убыванию счётчиков"""
+        self.assertEqual(hottest_paths(groups=1, profiles=1), [
+            "/", "/group/big/", "/profile/author/",
+        ])
+
+    def test_command_caches_pages(self):
+        """Команда кладёт страницы в кэш и печатает время каждой"""
+        out = StringIO()
+        call_command(
+            "warm_cache", concurrency=0, host="localhost", stdout=out
+        )
+        for path in hottest_paths():
+            self.assertIn(path, out.getvalue())
+        request = RequestFactory().get("/group/big/", HTTP_HOST="localhost")
+        self.assertIsNotNone(
+            cache.get(page_key("group:big", "group_page", request))
+        )
+
+    def test_boot_hook_warms_once_per_host(self):
+        """Прогрев начинается с первым запросом и только в одном воркере"""
+        with override_settings(WARM_CACHE_ON_BOOT=True), \
+                mock.patch("posts.warmup.threading.Thread") as thread:
+            warm_on_boot()
+            thread.assert_not_called()
+            self.client.get("/about/author/")
+            self.client.get("/about/author/")
+            warm_on_boot()
+            self.client.get("/about/author/")
+        thread.assert_called_once()
+
+    def test_boot_hook_is_off_by_default(self):
+        """Без WARM_CACHE_ON_BOOT воркер кэш не прогревает"""
+        with mock.patch("posts.warmup.threading.Thread") as thread:
+            warm_on_boot()
+            self.client.get("/about/author/")
+        thread.assert_not_called()
@@ -0,0 +1,232 @@
+import shutil
+import struct
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import (
+    SkipFile, TemporaryFileUploadHandler
+)
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Столько байт от начала файла хватает, чтобы Pillow прочитал
+# заголовок почти любой картинки, включая JPEG с большим EXIF.
+header_size: int = 256 * 1024
+# Запас на текстовые поля формы при проверке длины всего запроса.
+form_overhead: int = 64 * 1024
+copy_chunk_size: int = 64 * 1024
+
+EXIF_ORIENTATION = 0x0112
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp")
+# Метаданные PNG: EXIF и текстовые блоки, где бывают те же сведения.
+PNG_METADATA_CHUNKS = {b"eXIf", b"tEXt", b"zTXt", b"iTXt"}
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def check_image_header(header):
+    """Сообщение об ошибке по заголовку картинки или None.
+
+    Пиксели не декодируются: Pillow читает только заголовок, так что
+    картинка-бомба отсекается до распаковки.
+    """
+    try:
+        width, height = Image.open(BytesIO(header)).size
+    except UnidentifiedImageError:
+        return "Файл не является картинкой."
+    except Image.DecompressionBombError:
+        return pixels_error()
+    except (OSError, SyntaxError):
+        # Заголовок обрезан: решит полная проверка формы.
+        return None
+    if width * height > settings.MAX_IMAGE_PIXELS:
+        return pixels_error()
+    return None
+
+
+def pixels_error():
+    return (
+        f"Картинка слишком большая, допустимо не больше "
+        f"{settings.MAX_IMAGE_PIXELS} пикселей."
+    )
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку сразу во временный файл и обрывает её как можно
+    раньше: по объявленной длине запроса, по заголовку картинки и по
+    фактическому объёму.
+
+    Причина отказа попадает в request.upload_errors[имя поля],
+    остаток файла пропускается без записи на диск.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        files = settings.MAX_GALLERY_IMAGES + 1
+        self.too_long = content_length > (
+            settings.MAX_IMAGE_UPLOAD_SIZE * files + form_overhead
+        )
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if self.too_long or (
+            self.content_length
+            and self.content_length > settings.MAX_IMAGE_UPLOAD_SIZE
+        ):
+            self.reject(self.size_error())
+        if not self.content_type.startswith("image/"):
+            self.reject("Файл не является картинкой.")
+        self.received = 0
+        self.header = b""
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.reject(self.size_error())
+        if self.header is not None:
+            self.header += raw_data[:header_size - len(self.header)]
+            if len(self.header) >= header_size:
+                error = self.check_header()
+                if error:
+                    self.reject(error)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        # Здесь SkipFile парсер уже не ловит: файл просто не отдаётся.
+        error = self.check_header() if self.header else None
+        if error:
+            self.request.upload_errors[self.field_name] = error
+            self.file.close()
+            return None
+        return super().file_complete(file_size)
+
+    def check_header(self):
+        error = check_image_header(self.header)
+        self.header = None
+        return error
+
+    def reject(self, message):
+        self.request.upload_errors[self.field_name] = message
+        raise SkipFile(message)
+
+    @staticmethod
+    def size_error():
+        limit = filesizeformat(settings.MAX_IMAGE_UPLOAD_SIZE)
+        return f"Картинка больше {limit}."
+
+
+def streaming_image_uploads(view):
+    """Подключает ImageUploadHandler к view.
+
+    Обработчики загрузки меняются до чтения request.POST, поэтому
+    проверка CSRF переносится внутрь, как советует документация Django.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_errors = {}
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
+def copy_jpeg_without_app1(source, target):
+    """Копирует JPEG без сегментов APP1 (EXIF и XMP), сжатые данные
+    переносятся байт в байт. На разметке, которую не удалось
+    разобрать, - ValueError.
+    """
+    target.write(source.read(2))
+    while True:
+        marker = read_jpeg_marker(source)
+        if marker[1] == 0xDA:
+            target.write(marker)
+            shutil.copyfileobj(source, target, copy_chunk_size)
+            return
+        length_bytes = source.read(2)
+        if len(length_bytes) < 2:
+            raise ValueError("Обрезанный JPEG")
+        length, = struct.unpack(">H", length_bytes)
+        segment = source.read(length - 2)
+        if length < 2 or len(segment) != length - 2:
+            raise ValueError("Обрезанный JPEG")
+        if marker[1] != 0xE1:
+            target.write(marker + length_bytes + segment)
+
+
+def read_jpeg_marker(source):
+    """Маркер сегмента; байты-заполнители 0xFF перед ним пропускаются."""
+    if source.read(1) != b"\xff":
+        raise ValueError("Битый JPEG")
+    code = source.read(1)
+    while code == b"\xff":
+        code = source.read(1)
+    if not code:
+        raise ValueError("Обрезанный JPEG")
+    return b"\xff" + code
+
+
+def copy_png_without_metadata(source, target):
+    """Копирует PNG без блоков с метаданными."""
+    target.write(source.read(len(PNG_SIGNATURE)))
+    while True:
+        head = source.read(8)
+        if len(head) < 8:
+            return
+        length, chunk_type = struct.unpack(">I4s", head)
+        body = source.read(length + 4)
+        if chunk_type not in PNG_METADATA_CHUNKS:
+            target.write(head + body)
+
+
+def reencode_without_exif(source, target, image_format):
+    """Запасной путь: пересжатие с поворотом по EXIF и без метаданных."""
+    image = ImageOps.exif_transpose(Image.open(source))
+    options = {"quality": 95} if image_format in ("JPEG", "WEBP") else {}
+    image.save(target, image_format, **options)
+
+
+def strip_exif(upload):
+    """Возвращает загрузку без EXIF; без метаданных - её же.
+
+    JPEG и PNG очищаются без пересжатия. JPEG с поворотом в EXIF и
+    остальные форматы пересжимаются, иначе картинка перевернётся или
+    метаданные останутся.
+    """
+    image = getattr(upload, "image", None)
+    if image is None:
+        upload.seek(0)
+        image = Image.open(upload)
+    if not any(key in image.info for key in METADATA_KEYS):
+        return upload
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    cleaned = TemporaryUploadedFile(
+        upload.name, upload.content_type, 0, upload.charset,
+        upload.content_type_extra,
+    )
+    upload.seek(0)
+    try:
+        if image.format == "JPEG" and orientation == 1:
+            try:
+                copy_jpeg_without_app1(upload, cleaned)
+            except ValueError:
+                # Разметку не разобрали, но Pillow файл открыл: пересжатие.
+                cleaned.seek(0)
+                cleaned.truncate()
+                upload.seek(0)
+                reencode_without_exif(upload, cleaned, image.format)
+        elif image.format == "PNG":
+            copy_png_without_metadata(upload, cleaned)
+        else:
+            reencode_without_exif(upload, cleaned, image.format)
+    except (OSError, ValueError) as error:
+        cleaned.close()
+        raise ValidationError("Не удалось прочитать картинку.") from error
+    cleaned.size = cleaned.tell()
+    cleaned.seek(0)
+    cleaned.image = image
+    return cleaned
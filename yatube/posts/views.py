@@ -1,23 +1,30 @@
 from django.shortcuts import get_object_or_404, render, redirect
 from .models import Post, Group, User, Follow
-from django.core.paginator import Paginator
-from .forms import PostForm, CommentForm
+from .paginator import CommentPaginator, CursorPaginator
+from .feeds import FeedPaginator
+from .articles import attach_articles
+from .counters import get_user_stats
+from .images import attach_gallery, attach_thumbnails, schedule_thumbnails
+from .forms import PostForm, CommentForm, GalleryForm
+from .search import SearchPaginator
+from .uploads import streaming_image_uploads
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie
+from django.db import transaction
+from .cache import cache_page_by_generation
 
 set_limit: int = 10
+comments_limit: int = 20
 title_limit: int = 30
+page_cache_timeout: int = 60 * 60
 
 
-@cache_page(20, key_prefix='index_page')
-@vary_on_cookie
+@cache_page_by_generation(page_cache_timeout, "index_page", "index")
 def index(request):
     template = "posts/index.html"
-    posts = Post.objects.select_related("group")
-    paginator = Paginator(posts, set_limit)
-    page_num = request.GET.get("page")
-    page_obj = paginator.get_page(page_num)
+    posts = Post.objects.for_cards()
+    paginator = CursorPaginator(posts, set_limit)
+    page_cursor = request.GET.get("cursor")
+    page_obj = attach_articles(paginator.get_page(page_cursor))
     context = {
         "page_obj": page_obj,
         "posts": posts,
@@ -25,13 +32,14 @@ def index(request):
     return render(request, template, context)
 
 
+@cache_page_by_generation(page_cache_timeout, "group_page", "group:{slug}")
 def group_posts(request, slug):
     template = "posts/group_list.html"
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related("group")
-    paginator = Paginator(posts, set_limit)
-    page_num = request.GET.get("page")
-    page_obj = paginator.get_page(page_num)
+    posts = group.posts.for_cards()
+    paginator = CursorPaginator(posts, set_limit)
+    page_cursor = request.GET.get("cursor")
+    page_obj = attach_articles(paginator.get_page(page_cursor))
     context = {
         "page_obj": page_obj,
         "group": group,
@@ -39,32 +47,46 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@cache_page_by_generation(
+    page_cache_timeout, "profile_page", "profile:{username}"
+)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related("group")
-    count_posts = posts.count()
-    paginator = Paginator(posts, set_limit)
-    page_num = request.GET.get("page")
-    page_obj = paginator.get_page(page_num)
-    following = request.user.is_authenticated
-    if following:
-        following = author.following.filter(user=request.user).exists()
+    posts = author.posts.for_cards()
+    count_posts = get_user_stats(author.id).posts_count
+    paginator = CursorPaginator(posts, set_limit)
+    page_cursor = request.GET.get("cursor")
+    page_obj = attach_articles(paginator.get_page(page_cursor))
     context = {
         "author": author,
         "posts": posts,
         "count_posts": count_posts,
         "page_obj": page_obj,
-        "following": following
-
     }
     return render(request, "posts/profile.html", context)
 
 
+def search(request):
+    query = request.GET.get("q", "").strip()
+    paginator = SearchPaginator(query, set_limit)
+    page_obj = paginator.get_page(request.GET.get("cursor"))
+    context = {
+        "query": query,
+        "page_obj": page_obj,
+    }
+    return render(request, "posts/search.html", context)
+
+
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    username = get_object_or_404(User, id=post.author_id)
-    count_posts = Post.objects.filter(author=username).count()
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related("author", "group"), id=post_id
+    )
+    attach_thumbnails([post] + attach_gallery([post]))
+    username = post.author
+    count_posts = get_user_stats(post.author_id).posts_count
+    comments = CommentPaginator(
+        post.comments.select_related("author"), comments_limit
+    ).get_page(None)
     form = CommentForm()
     title = post.text[:title_limit]
     context = {
@@ -78,42 +100,84 @@ def post_detail(request, post_id):
     return render(request, "posts/post_detail.html", context)
 
 
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки "Показать ещё"."""
+    post = get_object_or_404(Post.objects.only("id"), id=post_id)
+    paginator = CommentPaginator(
+        post.comments.select_related("author"), comments_limit
+    )
+    context = {
+        "post": post,
+        "comments": paginator.get_page(request.GET.get("cursor")),
+    }
+    return render(request, "posts/includes/comments.html", context)
+
+
 @login_required
+@streaming_image_uploads
+@transaction.atomic
 def post_create(request):
     if request.method == "POST" or None:
-        form = PostForm(request.POST or None)
-        if form.is_valid():
+        form = PostForm(
+            request.POST or None,
+            files=request.FILES or None,
+            upload_errors=request.upload_errors,
+        )
+        gallery_form = GalleryForm(
+            request.POST,
+            files=request.FILES,
+            upload_errors=request.upload_errors,
+        )
+        if form.is_valid() and gallery_form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            schedule_thumbnails(post)
+            for image in gallery_form.save(post):
+                schedule_thumbnails(image)
             return redirect("posts:profile", username=post.author.username)
         context = {
             "form": form,
+            "gallery_form": gallery_form,
         }
         return render(request, "posts/create_post.html", context)
     form = PostForm()
     context = {
         "form": form,
+        "gallery_form": GalleryForm(),
     }
     return render(request, "posts/create_post.html", context)
 
 
 @login_required
+@streaming_image_uploads
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
-        instance=post
+        instance=post,
+        upload_errors=request.upload_errors,
+    )
+    gallery_form = GalleryForm(
+        request.POST or None,
+        files=request.FILES or None,
+        upload_errors=request.upload_errors,
     )
     is_edit = True
     if post.author.username != request.user.username:
         return redirect("posts:post_detail", post_id=post.id)
-    if form.is_valid():
+    if form.is_valid() and gallery_form.is_valid():
         post = form.save()
+        if "image" in form.changed_data:
+            schedule_thumbnails(post)
+        for image in gallery_form.save(post):
+            schedule_thumbnails(image)
         return redirect("posts:post_detail", post_id=post.id)
     context = {
         "form": form,
+        "gallery_form": gallery_form,
         "post": post,
         "is_edit": is_edit,
     }
@@ -121,6 +185,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -134,17 +199,15 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post = Post.objects.filter(
-        author__following__user=request.user
-    )
-    paginator = Paginator(post, set_limit)
-    page_num = request.GET.get("page")
-    page_obj = paginator.get_page(page_num)
+    paginator = FeedPaginator(request.user, set_limit)
+    page_cursor = request.GET.get("cursor")
+    page_obj = attach_articles(paginator.get_page(page_cursor))
     context = {"page_obj": page_obj}
     return render(request, "posts/follow.html", context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -153,6 +216,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     follower = get_object_or_404(
         Follow,
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.signals import request_started
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import reverse
+
+from .cache import acquire_lock
+from .models import Group, UserStats
+
+logger = logging.getLogger(__name__)
+
+warm_groups: int = 10
+warm_profiles: int = 10
+warm_concurrency: int = 4
+# Пока блокировка жива, другие воркеры хоста кэш не прогревают.
+warm_lock_timeout: int = 10 * 60
+
+_handler = None
+_handler_lock = threading.Lock()
+
+
+def hottest_paths(groups=warm_groups, profiles=warm_profiles):
+    """Главная, самые большие группы и самые читаемые профили.
+
+    Статистики просмотров нет, поэтому горячесть оценивается по
+    счётчикам: постам группы и подписчикам автора.
+    """
+    slugs = Group.objects.order_by("-posts_count", "pk").values_list(
+        "slug", flat=True
+    )[:groups]
+    usernames = UserStats.objects.order_by(
+        "-followers_count", "-posts_count", "pk"
+    ).values_list("user__username", flat=True)[:profiles]
+    return (
+        [reverse("posts:index")]
+        + [reverse("posts:group_list", args=[slug]) for slug in slugs]
+        + [reverse("posts:profile", args=[name]) for name in usernames]
+    )
+
+
+def warm_page(path, host, secure):
+    """Запрашивает страницу анонимно: её копия, карточки постов и
+    миниатюры попадают в кэш. Возвращает (path, статус, секунды).
+
+    Запрос проходит все middleware, как настоящий, но сигналы
+    request_started и request_finished не посылаются: прогрев идёт
+    рядом с живыми запросами воркера. Хост и схема должны совпадать
+    с боевыми, иначе ключ страницы будет другим.
+    """
+    started = time.perf_counter()
+    request = RequestFactory().get(path, HTTP_HOST=host, secure=secure)
+    try:
+        status = get_handler().get_response(request).status_code
+    except Exception:
+        logger.exception("Не удалось прогреть %s", path)
+        status = None
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+    return path, status, time.perf_counter() - started
+
+
+def get_handler():
+    global _handler
+    with _handler_lock:
+        if _handler is None:
+            handler = BaseHandler()
+            handler.load_middleware()
+            _handler = handler
+    return _handler
+
+
+def warm_pages(paths, host, secure=False, concurrency=warm_concurrency):
+    """Прогревает страницы не больше чем в concurrency потоков;
+    0 - по очереди в текущем потоке. Результаты идут в порядке paths.
+    """
+    if not concurrency:
+        for path in paths:
+            yield warm_page(path, host, secure)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        yield from pool.map(
+            warm_page, paths, [host] * len(paths), [secure] * len(paths)
+        )
+
+
+def warm_on_boot():
+    """Хук старта воркера (wsgi.py): при WARM_CACHE_ON_BOOT прогревает
+    кэш в фоне.
+
+    Прогрев начинается с первым запросом процесса, а не при импорте
+    wsgi.py: с --preload импорт идёт в мастере до fork. Прогревает
+    один воркер хоста - тот, кто взял блокировку.
+    """
+    if settings.WARM_CACHE_ON_BOOT:
+        request_started.connect(start_warmup, dispatch_uid="warm_on_boot")
+
+
+def start_warmup(sender, **kwargs):
+    request_started.disconnect(dispatch_uid="warm_on_boot")
+    if acquire_lock("warm_cache", warm_lock_timeout):
+        threading.Thread(target=warm_in_background, daemon=True).start()
+
+
+def warm_in_background():
+    started = time.perf_counter()
+    try:
+        results = list(warm_pages(
+            hottest_paths(), settings.WARM_CACHE_HOST,
+            settings.WARM_CACHE_SECURE,
+        ))
+    except Exception:
+        logger.exception("Прогрев кэша прерван")
+        return
+    finally:
+        connections.close_all()
+    for path, status, elapsed in results:
+        logger.info("Прогрев %s: %s за %.0f мс", path, status, elapsed * 1000)
+    logger.info(
+        "Прогрето %s страниц за %.1f с",
+        len(results), time.perf_counter() - started,
+    )
@@ -10,11 +10,18 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Запущены тесты: manage.py test или pytest.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
@@ -145,8 +152,66 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = "core.views.csrf_failure"
 
+# Авторы с числом подписчиков больше порога не раскладывают посты
+# по лентам: их посты подтягиваются и сливаются при чтении /follow/.
+FEED_FANOUT_THRESHOLD = 10000
+# Потоки, догружающие ленты, когда автор опускается до порога;
+# 0 - сразу после коммита в потоке запроса (так в тестах).
+FEED_WORKERS = 0 if TESTING else 1
+
+# Миниатюры создаются в фоне после загрузки картинки, а бэкенд
+# не даёт параллельным запросам создать одну миниатюру дважды.
+THUMBNAIL_BACKEND = 'posts.images.LockingThumbnailBackend'
+# 0 - миниатюры создаются сразу в потоке запроса. Так в тестах: фоновые
+# задачи пережили бы временный MEDIA_ROOT теста.
+THUMBNAIL_WORKERS = 0 if TESTING else 2
+
+# Загрузка картинок постов пишется сразу во временный файл и
+# обрывается по размеру файла и по числу пикселей из заголовка.
+MAX_IMAGE_UPLOAD_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40 * 1000 * 1000
+MAX_GALLERY_IMAGES = 10
+
+# Кэш общий для всех процессов хоста: файл в памяти (tmpfs), LRU
+# по числу записей и по объёму. Каталог закрыт для других
+# пользователей: в файле pickle. Тесты работают со своим кэшем, чтобы
+# cache.clear() не сбрасывал кэш запущенного на хосте сайта.
+_shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+if TESTING:
+    SHARED_CACHE_DIR = tempfile.mkdtemp(prefix='yatube-test-', dir=_shm_dir)
+    atexit.register(shutil.rmtree, SHARED_CACHE_DIR, True)
+    SHARED_CACHE_FILE = os.path.join(SHARED_CACHE_DIR, 'yatube.cache')
+else:
+    SHARED_CACHE_DIR = os.path.join(_shm_dir, f'yatube-{os.getuid()}')
+    SHARED_CACHE_FILE = os.environ.get(
+        'YATUBE_CACHE_FILE', os.path.join(SHARED_CACHE_DIR, 'yatube.cache')
+    )
+
+# Прогрев кэша при старте воркера (posts.warmup). Хост и схема должны
+# совпадать с боевыми: они входят в ключ копии страницы.
+WARM_CACHE_ON_BOOT = os.environ.get('YATUBE_WARM_CACHE') == '1'
+WARM_CACHE_HOST = os.environ.get('YATUBE_WARM_CACHE_HOST', 'localhost')
+WARM_CACHE_SECURE = os.environ.get('YATUBE_WARM_CACHE_SECURE') == '1'
+
+# Сокеты процессов для рассылки инвалидаций (core.bus).
+INVALIDATION_BUS_DIR = os.path.join(SHARED_CACHE_DIR, 'yatube-bus')
+
 CACHES = {
+    # Горячие ключи несколько секунд живут в памяти процесса.
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.tiered_cache.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': 5,
+            'LOCAL_MAX_ENTRIES': 200,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.shm_cache.SharedMemoryCache',
+        'LOCATION': SHARED_CACHE_FILE,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+            'SIZE': 128 * 1024 * 1024,
+        },
     }
 }